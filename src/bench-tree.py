@@ -0,0 +1,107 @@
+#!/usr/bin/python
+"""
+    Benchmarks the SkNode traversal layer on synthetic trees.
+
+    Two shapes of tree are built: a "deep" one, which is a single chain of
+    frames far deeper than the interpreter's recursion limit (as a call-graph
+    tree can be), and a "wide" one, shaped like a big comm->dso->symbol
+    profile. Each tree is then walked in the ways the GUI walks it: path
+    construction, aggregation of a key, timestamp minima, pretty printing and
+    the raw iterators.
+
+    USAGE: bench-tree.py [depth] [comms dsos symbols]
+
+"""
+
+import sys
+import time
+
+from skillion.tree import SkTree, SkCommandNode, SkLibraryNode, SkFunctionNode
+
+KEY = 'cycles'
+
+
+def deep_tree(depth):
+    root = SkTree('deep')
+    root.appendKey(KEY)
+    node = root
+    for i in range(depth):
+        child = SkFunctionNode('frame%d' % i)
+        node.appendChild(child)
+        node = child
+    node.setData(KEY, 1)
+    node.setTimestamp(KEY, 1)
+    root.buildIndex()
+    return root, node
+
+
+def wide_tree(comms, dsos, syms):
+    root = SkTree('wide')
+    root.appendKey(KEY)
+    leaf = None
+    tick = 0
+    for c in range(comms):
+        commNode = SkCommandNode('comm%d' % c)
+        root.appendChild(commNode)
+        for d in range(dsos):
+            dsoNode = SkLibraryNode('/usr/lib/lib%d.so' % d)
+            commNode.appendChild(dsoNode)
+            for s in range(syms):
+                tick += 1
+                leaf = SkFunctionNode('sym%d' % s)
+                leaf.setData(KEY, tick)
+                leaf.setTimestamp(KEY, tick)
+                dsoNode.appendChild(leaf)
+    root.buildIndex()
+    return root, leaf
+
+
+def timed(label, fn):
+    start = time.time()
+    fn()
+    dt = time.time()-start
+    print("    %-28s %10.3f ms" % (label, 1000.0*dt))
+
+
+def count(iterator):
+    n = 0
+    for node in iterator:
+        n += 1
+    return n
+
+
+def bench(name, build):
+    start = time.time()
+    root, leaf = build()
+    print("%s tree: %d nodes, built and indexed in %.3f ms" %
+          (name, root.nodeCount(), 1000.0*(time.time()-start)))
+
+    def leafPath():
+        leaf._path = None
+        leaf.getPath()
+    timed('getPath (deepest leaf)',   leafPath)
+    timed('iterPreOrder',             lambda: count(root.iterPreOrder()))
+    timed('iterPostOrder',            lambda: count(root.iterPostOrder()))
+    timed('iterLevelOrder',           lambda: count(root.iterLevelOrder()))
+    timed('getData (cold)',           lambda: root.getData(KEY))
+    timed('getData (cached)',         lambda: root.getData(KEY))
+    timed('getTimestamp (cold)',      lambda: root.getTimestamp(KEY))
+    timed('prettyPrint',              lambda: root.prettyPrint())
+    timed('topNodes (k=50)',          lambda: root.topNodes(KEY, 50))
+
+
+def main():
+    depth = 20000
+    shape = (20, 50, 100)
+    if len(sys.argv) > 1:
+        depth = int(sys.argv[1])
+    if len(sys.argv) > 4:
+        shape = tuple(int(a) for a in sys.argv[2:5])
+
+    print("Recursion limit is %d" % sys.getrecursionlimit())
+    bench('Deep (%d)' % depth, lambda: deep_tree(depth))
+    bench('Wide (%dx%dx%d)' % shape, lambda: wide_tree(*shape))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,11 @@
     This perf script file reads a perf.data file and populates a SQLite
     database with as much event data as we can reasonably obtain from it.
 
+    The summary tables (hierView, callView and the unique_* tables) and
+    their indexes are aggregated in memory as events arrive and written out
+    in trace_end(), so the database is complete as soon as perf's input
+    ends: a pipe (perf script -i -) is handled the same as a file.
+
     This script contains evil, but well-documented herein, hacks to
     circumvent SQLite's inability to store 64-bit unsigned integers.
 
@@ -25,10 +30,43 @@ sys.path.append(os.environ['PERF_EXEC_PATH'] +      \
 from perf_trace_context import *
 from EventClass import *
 
+# Optional: python-magic gives the hierView filetype column (see
+# dso_filetype()). Another module also called 'magic' (file-magic) has no
+# Magic class, and libmagic itself may fail to load:
+try:
+    import magic
+except ImportError:
+    magic = None
+_MAGIC = None
+if magic is not None and hasattr(magic, 'Magic'):
+    try:
+        _MAGIC = magic.Magic()
+    except magic.MagicException:
+        pass
+
 _DEBUG_THIS = False
 _START = None
 _EVENT_COUNT = 0
 
+# Interned callchain frames, (dso, symbol) -> id, and stacks, (parent stack
+# id, frame id) -> id; see intern_stack():
+_FRAMES = {}
+_STACKS = {}
+
+# Running aggregates of the summary tables, key -> [tally, samples, min tsc],
+# where the key is (comm, dso, symbol, event) for hierView and (comm, stack,
+# event) for callView; see aggregate():
+_HIER = {}
+_CALLS = {}
+
+# Event rows are inserted in batches of this many:
+_EVENT_ROWS = []
+EVENT_BATCH = 10000
+
+# With '--aggregate-only' after the database path, the per-sample "event"
+# table is left out, and only the summary tables are written:
+AGGREGATE_ONLY = '--aggregate-only' in sys.argv[2:]
+
 # --=[ EVIL HACKS ]==-
 #
 # SQLite does not have a 64-bit unsigned integer type. Go figure. Many, if
@@ -112,8 +150,31 @@ def trace_begin():
     """
     global _START
     _START = time.clock()
-    log('Creating "event" table')
     con.execute("""DROP TABLE IF EXISTS event;""")
+    if AGGREGATE_ONLY:
+        log('Not creating "event" table: aggregates only')
+    else:
+        create_event_table()
+
+    log('Creating "frame" and "stack" tables')
+    con.execute("""DROP TABLE IF EXISTS frame;""")
+    con.execute("""
+    CREATE TABLE frame (
+        id     INT4 PRIMARY KEY,
+        dso    TEXT,
+        symbol TEXT
+    );""")
+    con.execute("""DROP TABLE IF EXISTS stack;""")
+    con.execute("""
+    CREATE TABLE stack (
+        id     INT4 PRIMARY KEY,
+        parent INT4,
+        frame  INT4
+    );""")
+
+
+def create_event_table():
+    log('Creating "event" table')
     con.execute("""
     CREATE TABLE event (
         tsc    INT8,
@@ -124,8 +185,166 @@ def trace_begin():
         symbol TEXT,
         comm   TEXT,
         dso    TEXT,
-        period INT8
+        period INT8,
+        stack  INT4
+    );""")
+
+
+def intern_frame(dso, symbol):
+    """Returns the id of the (dso, symbol) frame, adding it if it's new"""
+    key = (dso, symbol)
+    fid = _FRAMES.get(key)
+    if fid is None:
+        fid = len(_FRAMES) + 1
+        _FRAMES[key] = fid
+        con.execute("insert into frame values(?, ?, ?)", (fid, dso, symbol))
+    return fid
+
+
+def intern_stack(callchain):
+    """
+    Returns the stack id of a callchain (as given to process_event() by perf,
+    innermost frame first), or None if the callchain is empty.
+
+    Stacks are stored as a trie: each stack is a (parent stack, frame) pair,
+    outermost caller first, so a call path and all of its prefixes are stored
+    once however many samples share them, and each event row needs only the
+    id of its innermost stack.
+
+    """
+    sid = None
+    for entry in reversed(callchain):
+        dso = entry.get('dso')
+        sym = entry.get('sym')
+        if sym is not None:
+            sym = sym.get('name')
+        key = (sid, intern_frame(dso, sym))
+        nid = _STACKS.get(key)
+        if nid is None:
+            nid = len(_STACKS) + 1
+            _STACKS[key] = nid
+            con.execute("insert into stack values(?, ?, ?)", (nid, sid, key[1]))
+        sid = nid
+    return sid
+
+
+def aggregate(table, key, count, tsc):
+    """Adds one sample of `count` events at time `tsc` to `table`[`key`]"""
+    acc = table.get(key)
+    if acc is None:
+        table[key] = [count, 1, tsc]
+    else:
+        acc[0] += count
+        acc[1] += 1
+        if tsc < acc[2]:
+            acc[2] = tsc
+
+
+def flush_events():
+    """
+    Inserts the buffered event rows. A row that can't be inserted is logged
+    and skipped, as when rows were inserted one at a time, and the rest of
+    the batch is still inserted, so that the event table agrees with the
+    summary tables but for the rows logged.
+
+    """
+    rows = _EVENT_ROWS
+    start = 0
+    while start < len(rows):
+        # executemany() takes the rows one at a time, and stops at the first
+        # that fails, having inserted those before it:
+        current = [start]
+        def feed():
+            for i in xrange(start, len(rows)):
+                current[0] = i
+                yield rows[i]
+        try:
+            con.executemany("insert into event values(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", feed())
+            break
+        except (sqlite3.Error, OverflowError) as e:
+            log('Could not insert event row {}: {}'.format(rows[current[0]], e))
+            start = current[0] + 1
+    del rows[:]
+
+
+def dso_filetype(dso):
+    """
+    Returns the libmagic description of the file `dso`, as the sqlite3xcu
+    extension's filetype() did, or None if python-magic is not installed or
+    the file can't be read.
+
+    """
+    if _MAGIC is None or not dso:
+        return None
+    try:
+        return _MAGIC.from_file(dso)
+    except Exception:
+        return None
+
+
+def write_summary_tables():
+    """
+    Writes the in-memory aggregates out as the hierView and callView tables,
+    with the unique_* tables and the indexes that Skillion reads them by.
+
+    """
+    log('Writing summary tables')
+    con.execute("""DROP TABLE IF EXISTS hierView;""")
+    con.execute("""
+    CREATE TABLE hierView (
+        comm     TEXT,
+        dso      TEXT,
+        symbol   TEXT,
+        event    TEXT,
+        label    TEXT,
+        filetype TEXT,
+        tally    INT8,
+        samples  INT8,
+        tsc      INT8
+    );""")
+    labels = {}
+    for dso in set(k[1] for k in _HIER):
+        labels[dso] = (os.path.basename(dso) if dso else None, dso_filetype(dso))
+    con.executemany("insert into hierView values(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (k + labels[k[1]] + tuple(v) for k, v in _HIER.iteritems()))
+
+    con.execute("""DROP TABLE IF EXISTS callView;""")
+    con.execute("""
+    CREATE TABLE callView (
+        comm    TEXT,
+        stack   INT4,
+        event   TEXT,
+        tally   INT8,
+        samples INT8,
+        tsc     INT8
     );""")
+    con.executemany("insert into callView values(?, ?, ?, ?, ?, ?)",
+            (k + tuple(v) for k, v in _CALLS.iteritems()))
+
+    if not AGGREGATE_ONLY:
+        con.executescript("""
+            CREATE INDEX event_dso_idx    ON event(dso);
+            CREATE INDEX event_comm_idx   ON event(comm);
+            CREATE INDEX event_symbol_idx ON event(symbol);
+            CREATE INDEX event_name_idx   ON event(name);
+        """)
+    con.executescript("""
+        DROP TABLE IF EXISTS unique_comms;
+        DROP TABLE IF EXISTS unique_symbols;
+        DROP TABLE IF EXISTS unique_events;
+        DROP TABLE IF EXISTS unique_dsos;
+        CREATE INDEX hierview_comm_idx   ON hierview(comm);
+        CREATE INDEX hierviw_dso_idx     ON hierview(dso);
+        CREATE INDEX hierview_symbol_idx ON hierview(symbol);
+        CREATE INDEX hierview_event_idx  ON hierview(event);
+        CREATE TABLE unique_comms   AS SELECT DISTINCT comm   AS name FROM hierView;
+        CREATE TABLE unique_symbols AS SELECT DISTINCT symbol AS name FROM hierView;
+        CREATE TABLE unique_events  AS SELECT DISTINCT event  AS name, SUM(tally) AS events,
+            SUM(samples) AS samples FROM hierView GROUP BY name;
+        CREATE TABLE unique_dsos    AS SELECT DISTINCT dso    AS name FROM hierView;
+        CREATE INDEX callview_comm_idx   ON callView(comm);
+    """)
+    log('Wrote {} hierView and {} callView rows'.format(len(_HIER), len(_CALLS)))
 
 
 #
@@ -168,12 +387,20 @@ def process_event(param_dict):
     else:
         symbol = None
 
+    # Callchains are only present if recorded with 'perf record -g':
+    stack = intern_stack( param_dict.get("callchain", []) )
+
+    aggregate(_HIER, (comm, dso, symbol, name), count, tsc)
+    if stack is not None:
+        aggregate(_CALLS, (comm, stack, name), count, tsc)
+
+    if AGGREGATE_ONLY:
+        return
+
     # Insert into event table:
-    try:
-        con.execute("insert into event values(?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                (tsc, ip, pid, tid, name, symbol, comm, dso, count))
-    except:
-        log('Caught exception: ' + sys.exc_info()[0])
+    _EVENT_ROWS.append((tsc, ip, pid, tid, name, symbol, comm, dso, count, stack))
+    if len(_EVENT_ROWS) >= EVENT_BATCH:
+        flush_events()
 
 
 def trace_unhandled(event_name, context, event_fields_dict):
@@ -182,6 +409,8 @@ def trace_unhandled(event_name, context, event_fields_dict):
 
 def trace_end():
     global _START
+    flush_events()
+    write_summary_tables()
     log('Closing database connection')
     con.commit()
     con.close()
@@ -192,5 +421,6 @@ def trace_end():
         rate = '<To infinity... and beyond!>'
 
     log('Processed {} event records in {} seconds ({} records per second)'.format(_EVENT_COUNT, dt, rate))
+    log('Interned {} distinct stacks over {} distinct frames'.format(len(_STACKS), len(_FRAMES)))
 
 con = database_connection()
@@ -1,7 +1,21 @@
 #!/usr/bin/python
 """
     This script takes a 'perf.data' file and populates a SQL database with
-    as much data as can be gleaned from it.
+    as much data as can be gleaned from it. Given '-', it reads a pipe-mode
+    perf stream from stdin instead, e.g.:
+
+        perf record -o - -e cycles,instructions -- ./prog | perf-roofline.py -
+
+    Given an executable (and its arguments), it runs it under 'perf record'
+    and streams the samples straight into the database, e.g.:
+
+        perf-roofline.py -e cycles,instructions -o prog.db ./prog --size 100
+
+    with no perf.data file on disk, unless one is asked for with -k.
+
+    The database, with its summary tables and indexes, is built in the one
+    pass that 'perf script' makes over the data. With -a, the per-sample
+    'event' table is left out and only the aggregated tables are written.
 
     Author: Emmet Caulfield
     $Id: perf-roofline.py 41 2013-08-05 14:56:04Z emmet $
@@ -13,9 +27,8 @@ import sys
 import re
 import os
 import errno
+import getopt
 import subprocess as sub
-#import sqlite3
-from pysqlite2 import dbapi2 as sqlite3
 import time
 
 from util import *
@@ -30,6 +43,7 @@ PERF_SCRIPT = 'perf-create-database.py'
 PERF_SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))    \
         + '/' + PERF_SCRIPT
 PERF_DB_PATH = 'perf.db'
+PERF_EVENTS = 'cycles,instructions'
 
 def this_script():
     return os.path.basename( sys.argv[0] )
@@ -37,7 +51,14 @@ def this_script():
 
 def usage():
     """Prints a usage message and bails"""
-    print("USAGE: %s [datafile|program]" % this_script())
+    print("USAGE: %s [-a] [-o database] [datafile|-]" % this_script())
+    print("       %s [-a] [-o database] [-e events] [-k perf.data] program [args...]" % this_script())
+    print("")
+    print("  -a            write only the aggregated tables, not one row per sample")
+    print("  -o database   database to write (default: <input>.db, or %s for '-')" % PERF_DB_PATH)
+    print("  -e events     events for 'perf record' to count (default: %s);" % PERF_EVENTS)
+    print("                programs only")
+    print("  -k perf.data  also keep the raw perf data in the given file; programs only")
     sys.exit(1)
 
 
@@ -148,12 +169,26 @@ def drop_perf_event_database(dbfile=PERF_DB_PATH):
             pass
 
 
-def create_perf_event_database( infile, dbfile=PERF_DB_PATH ):
-    """Generates a SQLite database from a perf data file"""
-
+def perf_script_command( infile, dbfile, aggregateOnly=False ):
+    """Returns the 'perf script' command that reads `infile` into `dbfile`"""
     # We can pass in the database path as a command-line argument:
     perfCmd=[PERF_EXE, 'script', '-i', infile, '-s', PERF_SCRIPT_PATH,
         dbfile]
+    if aggregateOnly:
+        perfCmd.append('--aggregate-only')
+    return perfCmd
+
+
+def create_perf_event_database( infile, dbfile=PERF_DB_PATH, aggregateOnly=False ):
+    """
+    Generates a SQLite database from a perf data file, or from a pipe-mode
+    perf stream on stdin if `infile` is '-' ('perf script' inherits our
+    stdin). The perf script aggregates the summary tables as the samples
+    arrive, so there is no second pass over the database afterwards.
+
+    """
+
+    perfCmd=perf_script_command(infile, dbfile, aggregateOnly)
     log( 'Running "{}" to generate database.'.format(perfCmd) )
     start = time.clock()
     try:
@@ -163,75 +198,43 @@ def create_perf_event_database( infile, dbfile=PERF_DB_PATH ):
     log( "Processed '{}' in {} seconds".format(infile, time.clock()-start) )
 
 
-def create_indexes_and_views(dbfile=PERF_DB_PATH):
-    start = time.clock()
-    log("Creating convenience tables and indexes")
-    con = sqlite3.connect(dbfile)
-    try:
-        con.enable_load_extension(True)
-        haveExtensions = True
-    except AttributeError as ae:
-        warn("Sqlite3 extensions not available; some features disabled")
-        haveExtensions = False
-
-    res = con.execute("SELECT COUNT(*) FROM event;")
-    rowCount, = res.fetchone()
-
-    sql = """
-        CREATE INDEX event_dso_idx    ON event(dso);
-        CREATE INDEX event_comm_idx   ON event(comm);
-        CREATE INDEX event_symbol_idx ON event(symbol);
-        CREATE INDEX event_name_idx   ON event(name);
-    """
-    con.executescript( sql );
-
-    if haveExtensions:
-        sql = """
-            SELECT load_extension('%s/sqlite3/sqlite3xcu.so');
-            CREATE TABLE dsos AS SELECT DISTINCT dso AS name, NULL AS label, NULL AS magic FROM event;
-            UPDATE dsos SET label=basename(name), magic=filetype(name);
-            CREATE TABLE hierView AS
-                SELECT e.comm AS comm, e.dso AS dso, e.symbol AS symbol, e.name AS event, d.label AS label,
-                       d.magic AS filetype, SUM(period) AS tally, COUNT(*) AS samples, MIN(tsc) AS tsc
-                    FROM event e, dsos d
-                    WHERE e.dso = d.name
-            GROUP BY e.comm, e.dso, e.symbol, event, label, filetype;
-            DROP TABLE dsos;
-        """ % os.path.dirname(sys.argv[0])
-    else:
-        sql = """
-            CREATE TABLE hierView AS
-              SELECT comm, dso, symbol, name AS event, SUM(period) AS tally, COUNT(*) AS samples, MIN(tsc) AS tsc
-                FROM event
-                GROUP BY comm, dso, symbol, event;
-        """
-
-    sql += """
-        CREATE INDEX hierview_comm_idx   ON hierview(comm);
-        CREATE INDEX hierviw_dso_idx     ON hierview(dso);
-        CREATE INDEX hierview_symbol_idx ON hierview(symbol);
-        CREATE INDEX hierview_event_idx  ON hierview(event);
-        CREATE TABLE unique_comms   AS SELECT DISTINCT comm   AS name FROM hierView;
-        CREATE TABLE unique_symbols AS SELECT DISTINCT symbol AS name FROM hierView;
-        CREATE TABLE unique_events  AS SELECT DISTINCT event  AS name, SUM(tally) AS events, 
-            SUM(samples) AS samples FROM hierView GROUP BY name;
-        CREATE TABLE unique_dsos    AS SELECT DISTINCT dso    AS name FROM hierView;
+def run_executable( argv, dbfile, events=PERF_EVENTS, keepfile=None, aggregateOnly=False ):
     """
+    Profiles the command `argv` into `dbfile`: 'perf record' writes its
+    samples to a pipe (-o -) that 'perf script' reads as they are made, so
+    the database is ready when the program exits and no perf.data file is
+    written, unless `keepfile` names one for 'tee' to copy the stream to.
 
-    con.executescript( sql );
-    con.close();
-    dt = time.clock()-start
+    """
+    recCmd=[PERF_EXE, 'record', '-g', '-e', events, '-o', '-', '--'] + argv
+    scriptCmd=perf_script_command('-', dbfile, aggregateOnly)
+    log( 'Running "{}" into "{}"'.format(recCmd, scriptCmd) )
+    start = time.time()
     try:
-        rate = rowCount/dt
-    except ZeroDivisionError:
-        rate = '<To infinity... and beyond!>'
-
-    log("Processed {} event records in {} seconds ({} records per second)".format(rowCount, dt, rate))
-
+        record = sub.Popen(recCmd, stdout=sub.PIPE)
+        if keepfile is not None:
+            log( "Keeping perf data in '{}'".format(keepfile) )
+            tee = sub.Popen(['tee', keepfile], stdin=record.stdout, stdout=sub.PIPE)
+            record.stdout.close()
+            source = tee
+        else:
+            tee = None
+            source = record
+        script = sub.Popen(scriptCmd, stdin=source.stdout)
+        # Close our copy, so that perf record gets SIGPIPE if perf script dies:
+        source.stdout.close()
+    except OSError as ose:
+        bail("Could not run {}: {}".format(recCmd[0], ose))
 
-def run_executable( infile ):
-    bail("Input file '%s' is executable, but %s can't do that yet" %          \
-            (infile, this_script()))
+    rc = script.wait()
+    recRc = record.wait()
+    if tee is not None:
+        tee.wait()
+    if rc != 0:
+        bail("Call to {} returned {}".format(scriptCmd, rc))
+    if recRc != 0:
+        warn("Call to {} returned {}".format(recCmd, recRc))
+    log( "Profiled '{}' in {} seconds".format(' '.join(argv), time.time()-start) )
 
 
 def main():
@@ -248,25 +251,50 @@ def main():
 
 
     # If we got this far, we at least have a working 'perf', but perhaps
-    # not one that matches the kernel version.
-    if len(sys.argv)==1:
+    # not one that matches the kernel version. Options stop at the first
+    # non-option, so that a program's own arguments are left alone:
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'ae:k:o:')
+    except getopt.GetoptError as goe:
+        warn(str(goe), logToo=False)
+        usage()
+    opts = dict(opts)
+    aggregateOnly = '-a' in opts
+    dbfile = opts.get('-o')
+
+    if len(args)==0:
         infile='perf.data'
         log("No filename given, defaulting to '%s'" % infile)
-    elif len(sys.argv)==2:
-        infile=sys.argv[1]
     else:
-        usage()
+        infile=args[0]
+
+    # -e and -k are options of 'perf record', so only apply to programs:
+    recordOpts = [o for o in ('-e', '-k') if o in opts]
 
-    if isa_perf_data_file( infile ):
-        dbfile = infile+'.db'
+    if infile == '-':
+        if recordOpts or len(args) > 1:
+            usage()
+        dbfile = dbfile or PERF_DB_PATH
         drop_perf_event_database(dbfile)
-        create_perf_event_database( infile, dbfile )
-        create_indexes_and_views(dbfile)
-    elif os.path.isfile(infile) and os.access(infile, os.X_OK):
-        run_executable( infile )
+        create_perf_event_database( infile, dbfile, aggregateOnly )
+    elif os.path.isfile(infile) and isa_perf_data_file( infile ):
+        if recordOpts or len(args) > 1:
+            usage()
+        dbfile = dbfile or infile+'.db'
+        drop_perf_event_database(dbfile)
+        create_perf_event_database( infile, dbfile, aggregateOnly )
     else:
-        bail( "Input file is neither perf data nor executable." )
-
+        # An executable file, or a program on the PATH:
+        if os.path.isfile(infile) and os.access(infile, os.X_OK):
+            exe = os.path.abspath(infile)
+        else:
+            exe = which(infile)
+        if exe is None:
+            bail( "Input file is neither perf data nor executable." )
+        dbfile = dbfile or os.path.basename(infile)+'.db'
+        drop_perf_event_database(dbfile)
+        run_executable( [exe] + args[1:], dbfile, opts.get('-e', PERF_EVENTS),
+                        opts.get('-k'), aggregateOnly )
 
 if __name__ == '__main__':
     main()
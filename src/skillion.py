@@ -1,32 +1,93 @@
 #!/usr/bin/python
+"""
+    USAGE: skillion.py [-g] [--stats] [--timing] [database]
+           skillion.py report [options] database
+           skillion.py batch [options] database...
+
+    The first form opens the GUI; the second prints or exports a table of
+    the hottest nodes without it (see skillion/report.py), and the third
+    renders the roofline of each database to an image, offscreen, in
+    parallel (see skillion/batch.py). Qt is only imported by the GUI, so
+    reports and batches run without a display.
+
+"""
+
+import time
+_START = time.time()
 
 import sys
 import os
 
-from PyQt4 import QtSql
-from PyQt4 import QtGui
 
-from skillion.ui.models import SkTreeModel
-from skillion.io.backend import SkSqliteBackend
-from skillion.ui.mainwindow import SkMainWindow
-from skillion.ui.controllers import SkController
+def gui(args):
+    # '--timing' reports how long start-up took, as each stage is reached:
+    timing = '--timing' in args
+    if timing:
+        args.remove('--timing')
+    def mark(stage):
+        if timing:
+            sys.stderr.write("startup: %-14s %8.1f ms\n" % (stage, 1000.0*(time.time()-_START)))
 
+    from PyQt4 import QtGui
+
+    from skillion.ui.models import SkTreeModel
+    from skillion.io.backend import SkSqliteBackend
+    from skillion.ui.mainwindow import SkMainWindow
+    from skillion.ui.controllers import SkController
+    mark('imports')
 
-if __name__ == '__main__':
     dbfile = "perf.data.db"
-    model  = None
 
     app = QtGui.QApplication(sys.argv)
 #    app.setStyle('windowsvista')
 
+    # A '-g' option asks for the call-graph rather than the flat hierarchy:
+    callgraph = '-g' in args
+    if callgraph:
+        args.remove('-g')
+
+    # '--stats' reports how many plot redraws were coalesced, on exit:
+    stats = '--stats' in args
+    if stats:
+        args.remove('--stats')
+
     # If an argument is given, assume it's a filename:
-    if len(sys.argv)>1:
-        dbfile = sys.argv[1]
+    if len(args)>0:
+        dbfile = args[0]
+
+    # Open the main window first, so that it shows while the data loads:
+    window = SkMainWindow()
+    controller = SkController(window)
+    app.processEvents()
+    mark('window shown')
 
     # If we have a filename, try creating a SkTreeModel from it:
     if os.path.isfile(dbfile):
-        model = SkTreeModel( SkSqliteBackend.buildSkTree(dbfile) )
+        if callgraph:
+            model = SkTreeModel( SkSqliteBackend.buildCallTree(dbfile) )
+        else:
+            model = SkTreeModel( SkSqliteBackend.buildSkTree(dbfile) )
+        mark('tree built')
+        controller.setModel(model)
+        app.processEvents()
+        mark('model ready')
+
+    status = app.exec_()
+    if stats and window.mplWidget.hasCanvas():
+        print "Plot:", window.mplWidget.redrawScheduler
+    return status
+
 
-    # Open the main window, populated with the model if we have one:
-    SkController(SkMainWindow(), model)
-    sys.exit(app.exec_())
+def main():
+    args = sys.argv[1:]
+    if args[:1] == ['report']:
+        from skillion.report import main as report
+        return report(args[1:])
+    if args[:1] == ['batch']:
+        from skillion.batch import main as batch
+        return batch(args[1:])
+    return gui(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
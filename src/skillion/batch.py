@@ -0,0 +1,216 @@
+"""
+    Offscreen batch rendering of rooflines: one image per database, drawn
+    with matplotlib's Agg canvas (no Qt, and no display, needed) in the same
+    style as the GUI's plot, with the CPI reference lines.
+
+    Each database is read and rendered by a worker in a process pool, so a
+    night's worth of benchmark runs renders about as many times faster as
+    there are cores.
+
+    USAGE: skillion.py batch [options] DATABASE...
+
+"""
+
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+
+from skillion.tree import SkTree, SkFunctionNode, SkCallNode
+from skillion.exceptions import SkError
+from skillion.io.base import SkDatabaseError
+from skillion.io.sqlite import SkSqlite3Backend
+
+FORMATS = ('png', 'svg')
+
+SCALES = {'lin': 0, 'log2': 2, 'log10': 10}
+
+
+def imageName(dbfile, parents=0):
+    """
+    Returns the name of the image of `dbfile`: its basename, less any '.db',
+    prefixed by its last `parents` directories, joined with '-'.
+
+    """
+    parts = os.path.normpath(os.path.abspath(dbfile)).split(os.sep)[1:]
+    name = parts[-1]
+    if name.endswith('.db'):
+        name = name[:-3]
+    return '-'.join(parts[len(parts)-1-parents:-1] + [name])
+
+
+def outputPaths(dbfiles, outdir, fmt):
+    """
+    Returns the image path of each database in `dbfiles`. Where databases
+    share a basename (say runA/perf.db and runB/perf.db), as many of their
+    parent directories are prefixed as it takes to tell them apart, so no
+    worker overwrites another's image. Raises SkError if that's impossible,
+    as for the same file given twice.
+
+    """
+    names = [None] * len(dbfiles)
+    pending = range(len(dbfiles))
+    parents = 0
+    while pending:
+        byName = {}
+        for i in pending:
+            names[i] = imageName(dbfiles[i], parents)
+            byName.setdefault(names[i], []).append(i)
+        clashes = [i for same in byName.itervalues() if len(same) > 1 for i in same]
+        if clashes and all(imageName(dbfiles[i], parents) == imageName(dbfiles[i], parents+1) for i in clashes):
+            raise SkError("databases would overwrite each other's image: %s"
+                          % ', '.join(dbfiles[i] for i in clashes))
+        pending = clashes
+        parents += 1
+    if len(set(names)) < len(names):
+        # A prefixed name can still clash with another database's own name:
+        raise SkError("databases would overwrite each other's image: %s"
+                      % ', '.join(db for db, name in zip(dbfiles, names) if names.count(name) > 1))
+    return [os.path.join(outdir, name + '.' + fmt) for name in names]
+
+
+def plotPoints(tree, xev, yev):
+    """
+    Returns the x and y values of every leaf node (function, or call-path
+    node) that has a non-zero value for both events, and the index of each
+    one's command, for colouring.
+
+    """
+    klass = SkCallNode if tree.getHierarchy() == SkTree.HIERARCHY_CALLGRAPH else SkFunctionNode
+    commands = {}
+    xs, ys, cs = [], [], []
+    for skNode, x, y in zip(tree.levelNodes(klass), tree.getColumn(xev, klass), tree.getColumn(yev, klass)):
+        if not x or not y:
+            continue
+        comm = skNode
+        while comm.parent() is not tree:
+            comm = comm.parent()
+        xs.append(x)
+        ys.append(y)
+        cs.append(commands.setdefault(comm.label, len(commands)))
+    return xs, ys, cs
+
+
+def render(tree, xev, yev, path, xbase=10, ybase=10, title=None):
+    """Renders the roofline of `tree` to `path`; returns the number of points"""
+    # Imported here, so that only the workers pay for it:
+    import numpy
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.collections import LineCollection
+    from skillion import plot
+
+    plot.applyRc()
+    fig = Figure(plot.FIGSIZE, dpi=plot.DPI)
+    FigureCanvasAgg(fig)
+    axes = fig.add_subplot(111)
+    plot.styleAxes(axes)
+
+    xs, ys, cs = plotPoints(tree, xev, yev)
+    if xs:
+        colors = [plot.paletteColor(c) for c in cs]
+        axes.scatter(numpy.array(xs, dtype=float), numpy.array(ys, dtype=float),
+                     s=plot.MARKER_SIZE, c=colors, marker='o', linewidths=0, zorder=2)
+    plot.setScales(axes, xbase, ybase)
+    axes.autoscale_view()
+
+    # With no points, the limits are matplotlib's defaults, which need not
+    # be positive, as the CPI lines on log axes need; the plot is just empty:
+    if xs:
+        xlim = axes.get_xlim()
+        segments, lineColors = plot.cpiGeometry(xbase, ybase, xlim)
+        axes.add_collection(LineCollection(segments, colors=lineColors, linewidths=1.0, zorder=1),
+                            autolim=False)
+        axes.set_xlim(xlim)
+
+    axes.set_xlabel(plot.axisLabel(xev, xbase))
+    axes.set_ylabel(plot.axisLabel(yev, ybase))
+    if title:
+        axes.set_title(title)
+    fig.savefig(path)
+    return len(xs)
+
+
+def renderDatabase(task):
+    """
+    Builds the tree of one database and renders it. Run in a worker, so
+    it returns (dbfile, output path, points, seconds, error message) rather
+    than raising.
+
+    """
+    dbfile, outpath, opts = task
+    start = time.time()
+    try:
+        if opts['callgraph']:
+            tree = SkSqlite3Backend.buildCallTree(dbfile)
+        else:
+            tree = SkSqlite3Backend.buildSkTree(dbfile)
+        keys = tree.getKeyList()
+        xev = opts['x'] or (keys[0] if keys else None)
+        yev = opts['y'] or (keys[1] if len(keys) > 1 else None)
+        for ev in (xev, yev):
+            if ev not in keys:
+                raise SkDatabaseError("no such event: %s" % ev)
+        n = render(tree, xev, yev, outpath, opts['xbase'], opts['ybase'],
+                   os.path.basename(dbfile))
+        return dbfile, outpath, n, time.time()-start, None
+    except Exception as e:
+        return dbfile, outpath, 0, time.time()-start, str(e)
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(prog='skillion.py batch',
+                                     description='Render the roofline of each database to an image, offscreen.')
+    parser.add_argument('databases', nargs='+', metavar='DATABASE')
+    parser.add_argument('-o', '--outdir', default='.', help='directory for the images (default: .)')
+    parser.add_argument('-f', '--format', choices=FORMATS, default='png')
+    parser.add_argument('-x', '--x-event', dest='x', help='x-axis event (default: the first)')
+    parser.add_argument('-y', '--y-event', dest='y', help='y-axis event (default: the second)')
+    parser.add_argument('--xscale', choices=sorted(SCALES.keys()), default='log10')
+    parser.add_argument('--yscale', choices=sorted(SCALES.keys()), default='log10')
+    parser.add_argument('-g', '--callgraph', action='store_true',
+                        help='plot call-path nodes rather than functions')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(),
+                        help='number of worker processes (default: the number of cores)')
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parseArgs(argv)
+    try:
+        paths = outputPaths(args.databases, args.outdir, args.format)
+    except SkError as e:
+        sys.stderr.write("skillion: %s\n" % e)
+        return 2
+    if not os.path.isdir(args.outdir):
+        os.makedirs(args.outdir)
+
+    opts = {
+        'x': args.x,
+        'y': args.y,
+        'xbase': SCALES[args.xscale],
+        'ybase': SCALES[args.yscale],
+        'callgraph': args.callgraph,
+    }
+    tasks = [(db, path, opts) for db, path in zip(args.databases, paths)]
+
+    start = time.time()
+    failures = 0
+    if args.jobs > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(args.jobs, len(tasks)))
+        results = pool.imap_unordered(renderDatabase, tasks)
+    else:
+        pool = None
+        results = (renderDatabase(t) for t in tasks)
+    for dbfile, outpath, n, dt, error in results:
+        if error is not None:
+            failures += 1
+            sys.stderr.write("skillion: %s: %s\n" % (dbfile, error))
+        else:
+            print "%s -> %s (%d points, %.2f s)" % (dbfile, outpath, n, dt)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    print "%d of %d rendered in %.2f s" % (len(tasks)-failures, len(tasks), time.time()-start)
+    return 1 if failures else 0
@@ -1,116 +1,63 @@
 from PyQt4 import QtSql
 from PyQt4 import QtCore
 
-from skillion.exceptions import SkError, SkAbstractMethodCalled
-from skillion.tree import SkTree, SkCommandNode, SkLibraryNode, SkFunctionNode
+# The Qt-free classes live in skillion.io.base, and are re-exported here:
+from skillion.io.base import SkDatabaseError, SkBackend, SkFileBackend, SkRowBackend
 
-class SkDatabaseError(SkError):
-    pass
 
 
-class SkBackend(object):
-    def __init__(self):
-        super(SkBackend,self).__init__()
-        
-    @classmethod
-    def buildSkTree(cls, datasource):
-        raise SkAbstractMethodCalled()
-
+class SkSqlBackend(SkRowBackend):
+    @staticmethod
+    def _pyValue(value):
+        """Converts a value read by QtSql to the equivalent plain Python value"""
+        if not isinstance(value, QtCore.QVariant):
+            return value
+        if value.isNull():
+            return None
+        t = value.type()
+        if t in (QtCore.QVariant.Int, QtCore.QVariant.UInt, QtCore.QVariant.LongLong, QtCore.QVariant.ULongLong):
+            # QVariant has a bug in its toInt() method that necessitates going via QString
+            return long(str(value.toString()))
+        if t == QtCore.QVariant.Double:
+            return value.toDouble()[0]
+        return str(value.toString())
 
-class SkFileBackend(SkBackend):
-    def __init__(self):
-        super(SkBackend,self).__init__()
 
     @classmethod
-    def fileMagic(cls):
-        """
-        Returns the file "magic" (characteristic initial bytes)
-        associated with the kind of file that this backend can handle.
-
-        """
-
-        raise SkAbstractMethodCalled()
-
-
-
-class SkSqlBackend(SkBackend):
-    @staticmethod
-    def _sqlGetList(db, tableName, columnName=None, whereEqual=None, distinct=True):
+    def _rows(cls, db, stmt):
         qry = QtSql.QSqlQuery(db)
         qry.setForwardOnly(True)
-
-        if columnName is None:
-            cols = '*'
-        elif isinstance(columnName, str):
-            cols = '"' + columnName + '"'
-        elif isinstance(columnName,  QtCore.QVariant):
-            cols = '"' + str(columnName.toString()) + '"'
-        else:
-            cols = '"' + ('", "'.join( [str(elt.toString() if isinstance(elt, QtCore.QVariant) else elt) for elt in columnName])) + '"'
-
-        stmt = "SELECT " +("DISTINCT " if distinct else " ")+ cols + ' FROM "%s"' % tableName
-
-        if whereEqual is not None:
-#        print( [type(v) for k,v in whereEqual.iteritems()] )
-            stmt += ' WHERE ' + ' AND '.join([str(k)+(" IS NULL" if v is None else ("='"+str(v.toString() if isinstance(v, QtCore.QVariant) else v)+"'")) for k,v in whereEqual.iteritems()])
-
-#    print stmt
         if not qry.exec_( stmt ):
             raise SkDatabaseError("SELECT failed:" + qry.lastError().text())
         numCols = qry.record().count()
-        nodes = []
+        rows = []
         while( qry.next() ):
-            nodes.append( [ qry.value(i) for i in range(numCols) ] )
-        
-        return nodes
-
-
-    @classmethod
-    def buildSkTree(cls, db):
-        root = SkTree('Skillion')
-        for row in cls._sqlGetList(db,  'hierView', 'event'):
-            for col in row:
-                s = str(col.toString() if isinstance(col, QtCore.QVariant) else col)
-                s = s.replace('-', '_')
-                root.appendKey(s)
-
-        comms = cls._sqlGetList(db, 'hierView', 'comm')
-        for comm, in comms:
-            commStr = str(comm.toString() if isinstance (comm, QtCore.QVariant) else comm)
-            commNode = SkCommandNode(commStr)
-            root.appendChild(commNode)
-            dsos = cls._sqlGetList(db, 'hierView', 'dso', {'comm':commStr})
-            for dso, in dsos:
-                dsoStr = str(dso.toString() if isinstance (dso, QtCore.QVariant) else dso)
-                dsoNode = SkLibraryNode(dsoStr)
-                commNode.appendChild(dsoNode)
-                syms = cls._sqlGetList(db, 'hierView', 'symbol', {'comm':commStr, 'dso':dsoStr})
-                for sym, in syms:
-                    symStr = str(sym.toString() if isinstance (sym, QtCore.QVariant) else sym)
-                    if not symStr:
-                        symStr = None
-                    symNode = SkFunctionNode(symStr)
-                    rawData = cls._sqlGetList(db, 'hierView', ['event', 'tally', 'tsc'], {'comm':commStr, 'dso':dsoStr, 'symbol':symStr}, False )
-                    for eventName, tally, tsc in rawData:
-                        # QVariant has a bug in its toInt() method that necessitates going via QString
-                        key = str(eventName.toString()).replace('-', '_')
-                        symNode.setData(key, tally.toString().toULongLong()[0])
-                        symNode.setTimestamp(key, tsc.toString().toULongLong()[0])
-                    dsoNode.appendChild(symNode)
-
-        return root
+            rows.append( tuple([ cls._pyValue(qry.value(i)) for i in range(numCols) ]) )
+        return rows
 
 
 class SkSqliteBackend(SkSqlBackend):
     @classmethod
-    def buildSkTree(cls, dbfile):
+    def _open(cls, dbfile):
         db = QtSql.QSqlDatabase.addDatabase("QSQLITE")
         db.setDatabaseName(dbfile)
         db.open()
+        return db
+
+    @classmethod
+    def buildSkTree(cls, dbfile):
+        db = cls._open(dbfile)
         tree = super(SkSqliteBackend,cls).buildSkTree(db)
         db.close()
         return tree
 
+    @classmethod
+    def buildCallTree(cls, dbfile):
+        db = cls._open(dbfile)
+        tree = super(SkSqliteBackend,cls).buildCallTree(db)
+        db.close()
+        return tree
+
     @classmethod
     def fileMagic(cls):
         return "SQLite format 3"
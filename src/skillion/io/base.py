@@ -0,0 +1,187 @@
+"""
+    The Qt-free part of the backends: the backend base classes, and the
+    builders that turn plain rows, as read by any database layer, into an
+    `SkTree`. Nothing here imports Qt, so trees can be built headless.
+
+"""
+
+from skillion.exceptions import SkError, SkAbstractMethodCalled
+from skillion.tree import SkTree, SkCommandNode, SkLibraryNode, SkFunctionNode, SkCallNode
+
+class SkDatabaseError(SkError):
+    pass
+
+
+class SkBackend(object):
+    def __init__(self):
+        super(SkBackend,self).__init__()
+
+    @classmethod
+    def buildSkTree(cls, datasource):
+        raise SkAbstractMethodCalled()
+
+
+class SkFileBackend(SkBackend):
+    def __init__(self):
+        super(SkBackend,self).__init__()
+
+    @classmethod
+    def fileMagic(cls):
+        """
+        Returns the file "magic" (characteristic initial bytes)
+        associated with the kind of file that this backend can handle.
+
+        """
+
+        raise SkAbstractMethodCalled()
+
+
+
+def text(value):
+    """Returns a column value as a label: SQL NULL (None) becomes ''"""
+    return '' if value is None else str(value)
+
+
+def eventKey(eventName):
+    """Returns the tree key for a perf event name, e.g. 'cache-misses'"""
+    return str(eventName).replace('-', '_')
+
+
+class SkRowBackend(SkBackend):
+    """
+    A backend that reads each table it needs with a single query, as plain
+    Python rows, and builds the tree from them in one pass. Subclasses
+    provide `_rows()` for their database layer.
+
+    """
+    HIER_QUERY   = 'SELECT comm, dso, symbol, event, tally, tsc FROM hierView'
+    FRAME_QUERY  = 'SELECT id, dso, symbol FROM frame'
+    STACK_QUERY  = 'SELECT id, parent, frame FROM stack'
+    CALL_QUERY   = 'SELECT comm, stack, event, tally, tsc FROM callView'
+
+    @classmethod
+    def _rows(cls, db, stmt):
+        """Returns an iterable of the rows (tuples of Python values) for `stmt`"""
+        raise SkAbstractMethodCalled()
+
+
+    @classmethod
+    def treeFromRows(cls, rows):
+        """
+        Builds a command/module/function tree from (comm, dso, symbol, event,
+        tally, tsc) rows. Nodes, and keys, are created in the order in which
+        they are first seen. Rows with a NULL tally are skipped.
+
+        """
+        root = SkTree('Skillion')
+        keys = set()
+        comms = {}
+        for comm, dso, sym, eventName, tally, tsc in rows:
+            if tally is None:
+                # No count, so nothing to add up (and no node to create)
+                continue
+            comm = text(comm)
+            if comm not in comms:
+                commNode = SkCommandNode(comm)
+                root.appendChild(commNode)
+                comms[comm] = (commNode, {})
+            commNode, dsos = comms[comm]
+
+            dso = text(dso)
+            if dso not in dsos:
+                dsoNode = SkLibraryNode(dso)
+                commNode.appendChild(dsoNode)
+                dsos[dso] = (dsoNode, {})
+            dsoNode, syms = dsos[dso]
+
+            sym = str(sym) if sym else None
+            symNode = syms.get(sym)
+            if symNode is None:
+                symNode = SkFunctionNode(sym)
+                dsoNode.appendChild(symNode)
+                syms[sym] = symNode
+
+            key = eventKey(eventName)
+            if key not in keys:
+                keys.add(key)
+                root.appendKey(key)
+            symNode.setData(key, long(tally))
+            if tsc is not None:
+                symNode.setTimestamp(key, long(tsc))
+
+        root.buildIndex()
+        return root
+
+
+    @classmethod
+    def callTreeFromRows(cls, frameRows, stackRows, callRows):
+        """
+        Builds a call-graph tree (see `skillion.tree`) from the rows of the
+        deduplicated stack tables: (id, dso, symbol) rows of `frame`, (id,
+        parent, frame) rows of `stack`, which is a trie of call paths, and
+        (comm, stack, event, tally, tsc) rows of `callView`. A node is created
+        once per distinct call path, so building the tree costs one step per
+        stack rather than one per sample.
+
+        """
+        root = SkTree('Skillion', SkTree.HIERARCHY_CALLGRAPH)
+
+        frames = {}
+        for fid, dso, sym in frameRows:
+            frames[int(fid)] = (text(dso), text(sym))
+
+        stacks = {}
+        for sid, parent, fid in stackRows:
+            # A NULL parent becomes 0, which is never a stack id:
+            stacks[int(sid)] = (int(parent or 0), int(fid))
+
+        keys = set()
+        comms = {}
+        for comm, sid, eventName, tally, tsc in callRows:
+            if tally is None:
+                continue
+            comm = text(comm)
+            if comm not in comms:
+                commNode = SkCommandNode(comm)
+                root.appendChild(commNode)
+                comms[comm] = (commNode, {})
+            commNode, callNodes = comms[comm]
+
+            # Find the deepest existing node on this call path, then create
+            # the missing frames on the way back down to this one:
+            sid = int(sid or 0)
+            pending = []
+            while sid and sid not in callNodes:
+                pending.append(sid)
+                sid = stacks[sid][0]
+            node = callNodes[sid] if sid else commNode
+            for sid in reversed(pending):
+                dso, sym = frames[stacks[sid][1]]
+                child = SkCallNode(sym, dso)
+                node.appendChild(child)
+                callNodes[sid] = child
+                node = child
+
+            key = eventKey(eventName)
+            if key not in keys:
+                keys.add(key)
+                root.appendKey(key)
+                root.appendKey(SkCallNode.exclusiveKey(key))
+            node.setData(SkCallNode.exclusiveKey(key), long(tally))
+            if tsc is not None:
+                node.setTimestamp(key, long(tsc))
+
+        root.buildIndex()
+        return root
+
+
+    @classmethod
+    def buildSkTree(cls, db):
+        return cls.treeFromRows(cls._rows(db, cls.HIER_QUERY))
+
+
+    @classmethod
+    def buildCallTree(cls, db):
+        return cls.callTreeFromRows(cls._rows(db, cls.FRAME_QUERY),
+                                    cls._rows(db, cls.STACK_QUERY),
+                                    cls._rows(db, cls.CALL_QUERY))
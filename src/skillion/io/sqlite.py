@@ -0,0 +1,49 @@
+"""
+    A backend that reads the perf databases with Python's own sqlite3
+    module rather than QtSql, so that trees can be built without Qt (and
+    without a display), e.g. for `skillion.py report`.
+
+"""
+
+import os
+import sqlite3
+
+from skillion.io.base import SkDatabaseError, SkFileBackend, SkRowBackend
+
+
+class SkSqlite3Backend(SkRowBackend, SkFileBackend):
+    @classmethod
+    def _open(cls, dbfile):
+        if not os.path.isfile(dbfile):
+            raise SkDatabaseError("No such database: " + dbfile)
+        db = sqlite3.connect(dbfile)
+        # Labels are byte strings everywhere else:
+        db.text_factory = str
+        return db
+
+    @classmethod
+    def _rows(cls, db, stmt):
+        try:
+            return db.execute(stmt)
+        except sqlite3.Error as e:
+            raise SkDatabaseError("SELECT failed:" + str(e))
+
+    @classmethod
+    def buildSkTree(cls, dbfile):
+        db = cls._open(dbfile)
+        try:
+            return super(SkSqlite3Backend,cls).buildSkTree(db)
+        finally:
+            db.close()
+
+    @classmethod
+    def buildCallTree(cls, dbfile):
+        db = cls._open(dbfile)
+        try:
+            return super(SkSqlite3Backend,cls).buildCallTree(db)
+        finally:
+            db.close()
+
+    @classmethod
+    def fileMagic(cls):
+        return "SQLite format 3"
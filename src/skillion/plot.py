@@ -0,0 +1,87 @@
+"""
+    The look of a Skillion roofline plot, independent of Qt: the figure
+    size, fonts and grid, the axis scales and labels, the point colours and
+    the geometry of the CPI reference lines (y = m*x). The GUI's
+    `SkPlotCanvas` and the offscreen batch renderer (see skillion/batch.py)
+    both draw with these, so their plots look the same.
+
+"""
+
+import math
+
+import numpy
+import matplotlib
+from matplotlib.colors import colorConverter as ColorConverter
+
+FIGSIZE = (8, 5)
+DPI = 96
+
+FONTSPEC = {
+    'family': 'sans-serif',
+    'weight': 'normal',
+    'size': '11'
+}
+
+# The colours given to points in turn:
+PALETTE = 'bgrcmyk'
+MARKER_SIZE = 36
+
+# CPI reference lines, as (slope, colour): 1, then 2..8 and 1/2..1/8
+CPI_SLOPES = [(1.0, '0.5')] + list((s, str(0.5+0.05*m)) for m in range(2, 9) for s in (m, 1.0/m))
+CPI_SAMPLES = 100
+
+
+def applyRc():
+    """Sets the matplotlib defaults that Skillion plots use"""
+    matplotlib.rcParams.update({'figure.autolayout': True})
+    matplotlib.rc('font', **FONTSPEC)
+
+
+def styleAxes(axes):
+    axes.grid(True, which='both', ls='-', color='0.75')
+    axes.set_axisbelow(True)
+
+
+def paletteColor(n):
+    """Returns the (r, g, b) colour of the n-th point plotted"""
+    return ColorConverter.to_rgb(PALETTE[n % len(PALETTE)])
+
+
+def setScales(axes, xbase, ybase):
+    """Makes each axis linear (base 0) or logarithmic in the given base"""
+    if xbase == 0:
+        axes.set_xscale('linear')
+    else:
+        axes.set_xscale('log', basex=xbase)
+
+    if ybase == 0:
+        axes.set_yscale('linear')
+    else:
+        axes.set_yscale('log', basey=ybase)
+
+
+def axisLabel(event, base):
+    if base == 0:
+        return event + ' [count]'
+    return event + ' [log_%s(count)]' % base
+
+
+def cpiGeometry(xbase, ybase, xlim, slopes=CPI_SLOPES):
+    """
+    Returns the (segments, colours) of the lines y = m*x, for each (m,
+    colour) in `slopes`, across the x limits `xlim`: as suitable for a
+    `LineCollection`.
+
+    """
+    # Straight lines need only their ends:
+    if xbase == ybase:
+        x = numpy.array(xlim)
+    elif xbase == 0:
+        x = numpy.linspace(xlim[0], xlim[1], CPI_SAMPLES)
+    else:
+        x = numpy.logspace(math.log(xlim[0], xbase), math.log(xlim[1], xbase),
+                           CPI_SAMPLES, True, xbase)
+
+    segments = [numpy.column_stack((x, m*x)) for m, color in slopes]
+    colors = [ColorConverter.to_rgba(color) for m, color in slopes]
+    return segments, colors
@@ -0,0 +1,137 @@
+"""
+    Headless reports: the top N nodes at one level of a profile, ranked by
+    a raw event or a computed column, printed as a table or exported as CSV
+    or JSON.
+
+    Nothing here (or in the modules it imports) needs Qt, matplotlib or
+    NumPy, so a report runs on a compute node without a display, and its
+    start-up time is that of reading the data.
+
+    USAGE: skillion.py report [options] DATABASE
+
+"""
+
+import sys
+import csv
+import json
+import argparse
+
+from skillion.tree import SkTree, SkColumnFormula, SkFormulaSyntaxError
+from skillion.tree import SkCommandNode, SkLibraryNode, SkFunctionNode, SkCallNode
+from skillion.io.base import SkDatabaseError
+from skillion.io.sqlite import SkSqlite3Backend
+
+LEVELS = {
+    'function': SkFunctionNode,
+    'module':   SkLibraryNode,
+    'command':  SkCommandNode,
+    'call':     SkCallNode,
+}
+
+FORMATS = ('text', 'csv', 'json')
+
+
+def reportRows(tree, key, k, klass, columns):
+    """
+    Returns the top `k` nodes of type `klass` by `key`, as a list of
+    [path, value of each of `columns`...] rows, largest first.
+
+    """
+    rows = []
+    for skNode, value in tree.topNodes(key, k, klass):
+        rows.append([skNode.getPath()] + [skNode.getData(c) for c in columns])
+    return rows
+
+
+def writeText(out, header, rows):
+    cells = [[str(h) for h in header]]
+    cells.extend([['' if v is None else str(v) for v in row] for row in rows])
+    widths = [max([len(row[i]) for row in cells]) for i in range(len(header))]
+    for n, row in enumerate(cells):
+        # The path is left-aligned and the numbers right-aligned:
+        line = [row[0].ljust(widths[0])] + [v.rjust(w) for v, w in zip(row[1:], widths[1:])]
+        out.write('  '.join(line).rstrip() + '\n')
+        if n == 0:
+            out.write('  '.join(['-'*w for w in widths]) + '\n')
+
+
+def writeCsv(out, header, rows):
+    writer = csv.writer(out)
+    writer.writerow(header)
+    writer.writerows(rows)
+
+
+def writeJson(out, header, rows, meta):
+    doc = dict(meta)
+    doc['columns'] = header
+    doc['rows'] = [dict(zip(header, row)) for row in rows]
+    json.dump(doc, out, indent=2)
+    out.write('\n')
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(prog='skillion.py report',
+                                     description='Print or export the hottest nodes of a profile database.')
+    parser.add_argument('database')
+    parser.add_argument('-g', '--callgraph', action='store_true',
+                        help='build the call-graph tree rather than command/module/function')
+    parser.add_argument('-n', '--top', type=int, default=20, metavar='N',
+                        help='number of rows (default: %(default)s)')
+    parser.add_argument('-l', '--level', choices=sorted(LEVELS.keys()),
+                        help="level of the hierarchy to rank (default: 'function', or 'call' with -g)")
+    parser.add_argument('-k', '--key',
+                        help='event or computed column to rank by (default: the first column)')
+    parser.add_argument('-c', '--column', action='append', default=[], metavar='FORMULA',
+                        help="add a computed column, e.g. 'ipc=instructions*1.0/cycles'")
+    parser.add_argument('-e', '--events', metavar='KEY,...',
+                        help='columns to show, in order (default: all)')
+    parser.add_argument('-f', '--format', choices=FORMATS, default='text')
+    parser.add_argument('-o', '--output', metavar='FILE', help='write to FILE rather than stdout')
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parseArgs(argv)
+
+    try:
+        if args.callgraph:
+            tree = SkSqlite3Backend.buildCallTree(args.database)
+        else:
+            tree = SkSqlite3Backend.buildSkTree(args.database)
+    except SkDatabaseError as e:
+        sys.stderr.write("skillion: %s\n" % e)
+        return 1
+
+    for string in args.column:
+        try:
+            formula = SkColumnFormula(string, tree.getKeyList())
+        except SkFormulaSyntaxError as e:
+            sys.stderr.write("skillion: bad column formula '%s': %s\n" % (string, e))
+            return 2
+        tree.setFormula(formula.label(), formula)
+
+    columns = args.events.split(',') if args.events else list(tree.getKeyList())
+    key = args.key or (columns[0] if columns else None)
+    for k in [key] + columns:
+        if k not in tree.getKeyList():
+            sys.stderr.write("skillion: no such event or column: %s\n" % k)
+            return 2
+    if key not in columns:
+        columns.insert(0, key)
+
+    level = args.level or ('call' if tree.getHierarchy() == SkTree.HIERARCHY_CALLGRAPH else 'function')
+    rows = reportRows(tree, key, args.top, LEVELS[level], columns)
+    header = ['path'] + columns
+
+    out = open(args.output, 'wb') if args.output else sys.stdout
+    try:
+        if args.format == 'csv':
+            writeCsv(out, header, rows)
+        elif args.format == 'json':
+            writeJson(out, header, rows, {'database': args.database, 'level': level, 'key': key})
+        else:
+            writeText(out, header, rows)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
@@ -0,0 +1,150 @@
+"""
+    Find-as-you-type search over the nodes of an SkTree.
+
+    An `SkTrigramIndex` maps every three-character substring (trigram) of the
+    node labels to the labels that contain it. A query is answered by
+    intersecting the (usually short) lists of labels containing each of its
+    trigrams and then checking the few survivors, so the cost depends on the
+    number of matches rather than on the size of the tree.
+"""
+
+from skillion.tree import SkLibraryNode
+
+
+def trigrams(text):
+    """Returns the set of trigrams of `text`"""
+    return set([text[i:i+3] for i in range(len(text)-2)])
+
+
+class SkTrigramIndex(object):
+    """
+    A case-insensitive substring index over node labels (and the full names
+    of libraries). Since many nodes share a label (the same function appears
+    under many commands), the index is built over the distinct labels, each of
+    which lists the ids of its nodes.
+
+    A query containing '/' is taken to be (part of) a path, as shown by
+    `SkNode.getPath()`: its last component is looked up in the index, and the
+    candidates are then checked against the labels of their ancestors. Paths
+    are made of labels, so libraries match by their basenames there, and a
+    leading '/' anchors the query at the top of the tree (the commands).
+
+    """
+    def __init__(self, tree):
+        super(SkTrigramIndex, self).__init__()
+        self._tree   = tree
+        self._labels = []
+        self._nodeIds = []
+        self._postings = {}
+        # The numbers of the texts that are some node's label, rather than
+        # only a library's full name:
+        self._isLabel = set()
+
+        labelNumbers = {}
+        for skNode in tree.iterPreOrder():
+            if skNode is tree:
+                continue
+            names = [skNode.label]
+            if isinstance(skNode, SkLibraryNode) and skNode.name != skNode.label:
+                names.append(skNode.name)
+            for j, name in enumerate(names):
+                text = name.lower()
+                n = labelNumbers.get(text)
+                if n is None:
+                    n = len(self._labels)
+                    labelNumbers[text] = n
+                    self._labels.append(text)
+                    self._nodeIds.append([])
+                    for t in trigrams(text):
+                        self._postings.setdefault(t, []).append(n)
+                if j == 0:
+                    self._isLabel.add(n)
+                ids = self._nodeIds[n]
+                if not ids or ids[-1] != skNode.id:
+                    ids.append(skNode.id)
+
+
+    def _labelMatches(self, text):
+        """Returns the numbers of the labels containing `text`, in order"""
+        grams = trigrams(text)
+        if not grams:
+            # Too short to index, so check every label:
+            return [n for n, label in enumerate(self._labels) if text in label]
+
+        postings = []
+        for t in grams:
+            p = self._postings.get(t)
+            if p is None:
+                return []
+            postings.append(p)
+        postings.sort(key=len)
+
+        candidates = set(postings[0])
+        for p in postings[1:]:
+            candidates.intersection_update(p)
+            if not candidates:
+                return []
+        labels = self._labels
+        return sorted([n for n in candidates if text in labels[n]])
+
+
+    def search(self, text, limit=None):
+        """
+        Returns up to `limit` nodes whose label (or, for a query containing
+        '/', whose path) contains `text`, in tree order.
+
+        """
+        if isinstance(text, unicode):
+            # The labels are (UTF-8) byte strings:
+            text = text.encode('utf-8')
+        text = text.lower().rstrip('/')
+        if not text:
+            return []
+
+        isPath = '/' in text
+        word = text.rsplit('/', 1)[-1] if isPath else text
+
+        ids = set()
+        for n in self._labelMatches(word):
+            if isPath and n not in self._isLabel:
+                continue
+            ids.update(self._nodeIds[n])
+        ids = sorted(ids)
+
+        parts = text.split('/')
+        nodes = []
+        for i in ids:
+            skNode = self._tree.getNode(i)
+            if isPath and not self._pathMatches(skNode, parts):
+                continue
+            nodes.append(skNode)
+            if limit is not None and len(nodes) >= limit:
+                break
+        return nodes
+
+
+    def _pathLabel(self, skNode):
+        # The root contributes an empty component to paths
+        return '' if skNode is self._tree else skNode.label.lower()
+
+
+    def _pathMatches(self, skNode, parts):
+        """
+        True if '/'.join(parts) occurs in the node's path and ends in its
+        label, checked one ancestor at a time rather than by building the path.
+        If parts[0] is empty (the query began with '/'), it must occur at the
+        start of the path.
+
+        """
+        if not self._pathLabel(skNode).startswith(parts[-1]):
+            return False
+        for part in reversed(parts[1:-1]):
+            skNode = skNode.parent()
+            if skNode is None or self._pathLabel(skNode) != part:
+                return False
+        skNode = skNode.parent()
+        if skNode is None:
+            return False
+        if not parts[0]:
+            return skNode is self._tree
+        return self._pathLabel(skNode).endswith(parts[0])
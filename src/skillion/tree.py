@@ -14,11 +14,26 @@
     The `SkNode` is an abstract base node, never directly instantiated. There is
     exactly one `SkRootNode`, and the hierarchical relationship is as shown
     above.
+
+    When callchains have been recorded, the tree may instead be built in
+    call-graph mode, in which each command's children are the outermost
+    callers, and each SkCallNode below them is one frame on a call path:
+
+        SkTree,
+           SkCommandNode (comm),
+              SkCallNode (caller),
+                 SkCallNode (callee), ...
+
+    In this mode, every event key has an exclusive counterpart (see
+    `SkCallNode.exclusiveKey()`) counting only the samples taken in the frame
+    itself, while the plain key counts the whole call path (inclusive).
 """
 
 import re
 import os
 import sys
+import heapq
+import collections
 
 from skillion.exceptions import SkError
 
@@ -60,11 +75,61 @@ class SkColumnFormula(object):
         return self._needkeys
 
 
+def _popcount(mask):
+    return bin(mask).count('1')
+
+
+class SkKeyTable(object):
+    """
+    Maps keys to single-bit masks. Each tree has its own table, shared by all
+    of its nodes, so that a node can record which keys it has values for in
+    one integer bitmap (see `SkNode`). Bits are allocated on first use, and
+    those of released keys (e.g. removed formulas) are reused.
+
+    """
+    def __init__(self):
+        super(SkKeyTable, self).__init__()
+        self._bits = {}
+        # The key of each bit position, or None if the bit is free:
+        self._keys = []
+        self._free = []
+
+    def bit(self, key):
+        try:
+            return self._bits[key]
+        except KeyError:
+            if self._free:
+                i = self._free.pop()
+                self._keys[i] = key
+            else:
+                i = len(self._keys)
+                self._keys.append(key)
+            bit = 1 << i
+            self._bits[key] = bit
+            return bit
+
+    def release(self, key):
+        """
+        Frees the bit of `key` for reuse. No node may still have the bit set
+        (see `SkNode._forget()`).
+
+        """
+        bit = self._bits.pop(key, None)
+        if bit is not None:
+            i = bit.bit_length() - 1
+            self._keys[i] = None
+            self._free.append(i)
+
+    def keys(self, mask):
+        """Returns the keys whose bits are set in `mask`, in bit order"""
+        return [k for i, k in enumerate(self._keys) if mask >> i & 1]
+
+
 class SkNode(object):
     """
-    Every `SkNode` has a set of key-value pairs in `_data`. The keys are, in
-    general, hardware event names from the database (perf.data via SQL), and the
-    values are the corresponding counts.
+    Every `SkNode` has a set of key-value pairs (see `getData()`). The keys are,
+    in general, hardware event names from the database (perf.data via SQL), and
+    the values are the corresponding counts.
 
     Since not every command/library/function necessarily has a value (count) for
     every key (hardware event name), and it is necessary to have a unique
@@ -80,7 +145,20 @@ class SkNode(object):
     kind, which involves some kind of calculation based on other hardware event
     counts.
 
+    Most nodes only have values for a few of the keys, so the values are
+    stored sparsely: `_present` is a bitmap (see `SkKeyTable`) of the keys
+    that have a value, `_values` holds just those values, packed in bit order,
+    and `_known` is a bitmap of the keys whose value has been set or computed,
+    including those known to have no value. Recording that a key has no value
+    therefore costs one bit rather than a dictionary entry.
+
+    The bits come from the `SkKeyTable` of the tree that the node is in (see
+    `_adopt()`); a node that isn't in a tree yet uses a table shared by all
+    such nodes.
+
     """
+    _keyTable = SkKeyTable()
+
     def __init__(self, name):
         super(SkNode, self).__init__()
 
@@ -88,25 +166,144 @@ class SkNode(object):
         self.label     = name
         self._parent   = None
         self._children = []
-        self._data      = {}
+        self._present   = 0
+        self._known     = 0
+        self._values    = []
         self._timestamp = {}
         self._formulas  = {}
         self._parentHasSameLabel = False
         self._color = None
         self._ischecked = False
+        self._path = None
+        self.id = None
 
 
+    def getId(self):
+        """Returns the integer id assigned by `SkTree.buildIndex()`"""
+        return self.id
+
     def getPath(self):
-        if self._parent:
-            return self._parent.getPath() +'/'+ self.label
-        else:
-            return ''
+        if self._path is None:
+            # Only this node's path is cached: caching every ancestor's as
+            # well would cost memory quadratic in the depth of the tree.
+            labels = [self.label]
+            labels.extend([node.label for node in self.iterAncestors()])
+            labels.pop()
+            labels.append('')
+            self._path = '/'.join(reversed(labels)) if self._parent else ''
+        return self._path
+
+    def getPathTuple(self):
+        """
+        Returns the tuple of (interned) node names from the top of the
+        hierarchy down to and including this node; the root's is empty.
+
+        """
+        names = [intern(self.name)]
+        names.extend([node.name for node in self.iterAncestors()])
+        names.pop()
+        return tuple(reversed(names)) if self._parent else ()
+
+
+    # Traversal
+    #
+    # All tree walks are done with an explicit stack (or queue) rather than by
+    # recursion, so that they are not limited by the interpreter's recursion
+    # limit and do not pay for a Python frame per node. Call-graph trees can
+    # easily be thousands of levels deep.
+
+    def iterAncestors(self):
+        """Yields the parent of this node, its parent, and so on up to the root"""
+        node = self._parent
+        while node is not None:
+            yield node
+            node = node._parent
+
+    def iterPreOrder(self, prune=None):
+        """
+        Yields this node and its descendants, parents before children.
+
+        If `prune` is given, it is called on every node yielded, and the
+        descendants of nodes for which it returns true are skipped.
+
+        """
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            if node._children and (prune is None or not prune(node)):
+                stack.extend(reversed(node._children))
+
+    def iterPreOrderWithDepth(self):
+        """Yields (depth, node) pairs in pre-order, this node being at depth 0"""
+        stack = [(0, self)]
+        while stack:
+            depth, node = stack.pop()
+            yield depth, node
+            depth += 1
+            stack.extend([(depth, child) for child in reversed(node._children)])
+
+    def iterPostOrder(self, prune=None):
+        """
+        Yields this node and its descendants, children before parents.
+
+        If `prune` is given, nodes for which it returns true are yielded
+        without first visiting their descendants.
+
+        """
+        stack = [(self, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded or not node._children or (prune is not None and prune(node)):
+                yield node
+            else:
+                stack.append((node, True))
+                stack.extend([(child, False) for child in reversed(node._children)])
+
+    def iterLevelOrder(self):
+        """Yields this node and its descendants breadth-first"""
+        queue = collections.deque([self])
+        while queue:
+            node = queue.popleft()
+            yield node
+            queue.extend(node._children)
+
+    def iterLevel(self, depth):
+        """Yields the descendants exactly `depth` levels below this node"""
+        level = [self]
+        for i in range(depth):
+            level = [child for node in level for child in node._children]
+        return iter(level)
 
     def appendChild(self, node):
         self._children.append(node)
         if node.label == self.label:
             node._parentHasSameLabel = True
         node._parent = self
+        node._adopt(self._keyTable)
+
+
+    def _adopt(self, keyTable):
+        """
+        Moves this node and its descendants over to `keyTable`, translating
+        the bits of any values they already have.
+
+        """
+        if self._keyTable is keyTable:
+            return
+        for node in self.iterPreOrder():
+            old = node._keyTable
+            node._keyTable = keyTable
+            if not node._known:
+                continue
+            values = zip(old.keys(node._present), node._values)
+            absent = old.keys(node._known & ~node._present)
+            node._present = node._known = 0
+            node._values = []
+            for key, value in values:
+                node._store(keyTable.bit(key), value)
+            for key in absent:
+                node._store(keyTable.bit(key), None)
 
 
     def isJunior(self):
@@ -115,6 +312,7 @@ class SkNode(object):
 
     def insertChild(self, pos, node):
         self._children.insert(pos,  node)
+        node._adopt(self._keyTable)
 
     def removeChild(self, pos):
         node = self._children.pop(pos)
@@ -134,15 +332,17 @@ class SkNode(object):
         return len(self._children)
 
     def hasKey(self, key):
-        return key in self._data or key in self._formulas
+        return bool(self._known & self._keyTable.bit(key)) or key in self._formulas
 
     def getData(self, key, calculationMode=False):
-        if key not in self._data:
+        bit = self._keyTable.bit(key)
+        if not self._known & bit:
             # In any case, if we can compute a value, it's OK to cache it, since
             # the underlying data is entirely static.
 
             # First, check if we have a formula for computing the data:
             formula = self.getFormula(key)
+            doEval = False
             if formula is not None:
                 # Make sure that we have data for all the keys needed by the formula:
                 doEval = True
@@ -156,40 +356,98 @@ class SkNode(object):
 #                        # A value required by the formula expression is None
 #                        doEval = False
 #                        break
-                if doEval:
+            if doEval:
+                try:
                     value = eval( formula.expression() )
-                    if value == 0:
-                        value = None
-                    self._data[key] = value
-                    return value
-
-            # If we get to here, we have no formula, or the formula didn't work out,
-            # so we see if we can aggregate the values from children:
-            total = 0
-            for child in self._children:
-                count = child.getData(key)
-                if count is not None:
-                    total += count
-            if total!=0:
-                self._data[key] = total
+                except ArithmeticError:
+                    # e.g. a ratio over a key the node has no value for:
+                    value = None
+                if value == 0:
+                    value = None
+                self._store(bit, value)
             else:
-                self._data[key] = None
+                # If we get to here, we have no formula, or the formula didn't
+                # work out, so we see if we can aggregate the values from
+                # children:
+                self._aggregate(key, bit)
 
+        value = self._fetch(bit)
         if calculationMode:
-            if self._data[key] is None:
+            if value is None:
                 return 0
-        return self._data[key]
+        return value
+
+
+    def _fetch(self, bit):
+        """Returns the value stored for the key with the given bit, or None"""
+        if self._present & bit:
+            return self._values[_popcount(self._present & (bit-1))]
+        return None
+
+
+    def _store(self, bit, value):
+        """Stores (or, for None, records the absence of) a value"""
+        rank = _popcount(self._present & (bit-1))
+        if self._present & bit:
+            if value is None:
+                del self._values[rank]
+                self._present &= ~bit
+            else:
+                self._values[rank] = value
+        elif value is not None:
+            self._values.insert(rank, value)
+            self._present |= bit
+        self._known |= bit
+
+
+    def _forget(self, bit):
+        """Discards any value, or record of absence, for the given key bit"""
+        self._store(bit, None)
+        self._known &= ~bit
+
+
+    def getDataDict(self):
+        """Returns a dict of the keys that have values and their values"""
+        return dict(zip(self._keyTable.keys(self._present), self._values))
+
+
+    def _aggregate(self, key, bit):
+        """
+        Sums the values of `key` from the bottom of the subtree up, caching the
+        total at every node on the way. Subtrees that already have a cached
+        value are not descended into.
+
+        Formulas are only ever set on the root, so if this node has no usable
+        formula for `key`, neither have any of its descendants.
+
+        """
+        for node in self.iterPostOrder(prune=lambda n: n._known & bit):
+            if not node._known & bit:
+                node._store(bit, node._combine(key, bit))
+
+
+    def _combine(self, key, bit):
+        """Returns the value of `key` computed from the children's cached values"""
+        total = 0
+        for child in self._children:
+            count = child._fetch(bit)
+            if count is not None:
+                total += count
+        if total!=0:
+            return total
+        return None
 
 
     def setData(self, key, value):
-        self._data[key] = value
+        self._store(self._keyTable.bit(key), value)
 
 
     def getFormula(self, key):
         if key in self._formulas:
             return self._formulas[key]
-        elif self._parent is not None:
-            return self._parent.getFormula(key)
+        for node in self.iterAncestors():
+            if key in node._formulas:
+                return node._formulas[key]
         return None
 
 
@@ -205,15 +463,19 @@ class SkNode(object):
 
     def getTimestamp(self, key):
         if key not in self._timestamp:
-            minimum = sys.maxint
-            for child in self._children:
-                tmp = child.getTimestamp()
-                if tmp is not None and tmp < minimum:
-                    minimum = tmp
-            if minimum != sys.maxint:
-                self._timestamp[key] = minimum
-            else:
-                self._timestamp[key] = None
+            # As for _aggregate(), but taking the minimum of the children:
+            for node in self.iterPostOrder(prune=lambda n: key in n._timestamp):
+                if key in node._timestamp:
+                    continue
+                minimum = sys.maxint
+                for child in node._children:
+                    tmp = child._timestamp[key]
+                    if tmp is not None and tmp < minimum:
+                        minimum = tmp
+                if minimum != sys.maxint:
+                    node._timestamp[key] = minimum
+                else:
+                    node._timestamp[key] = None
 
         return self._timestamp[key]
 
@@ -232,15 +494,10 @@ class SkNode(object):
         self._color = color
 
     def prettyPrint(self,  tabLevel=-1):
-        s = ""
-        tabLevel += 1
-        while range(tabLevel):
-            s += '    '
-        s += "`---" + self.name + '    ' + str(self._data) + '\n'
-        for node in self._children:
-            s += node.prettyPrint(tabLevel)
-        tabLevel -= 1
-        return s
+        lines = []
+        for depth, node in self.iterPreOrderWithDepth():
+            lines.append('    '*(tabLevel+1+depth) + "`---" + node.name + '    ' + str(node.getDataDict()) + '\n')
+        return ''.join(lines)
 
     @classmethod
     def testTree(cls):
@@ -255,9 +512,121 @@ class SkNode(object):
 
 
 class SkTree(SkNode):
-    def __init__(self, name):
+    """
+    The root of the hierarchy, which holds the key list and, once
+    `buildIndex()` has been called, the node indexes.
+
+    Every node in the tree is given a stable integer id, which is its position
+    in a pre-order walk of the tree at the time the index is built. Nodes can
+    then be looked up by id, by path tuple (e.g. `('a.out', '/tmp/a.out',
+    'main')`) or by name without walking the tree.
+
+    The path index is keyed on (parent id, interned name) pairs rather than
+    on whole path tuples, so that it stays linear in the size of the tree
+    however deep the tree is; a path lookup costs one dict probe per level.
+
+    """
+    HIERARCHY_FLAT      = 'flat'
+    HIERARCHY_CALLGRAPH = 'callgraph'
+
+    def __init__(self, name, hierarchy=HIERARCHY_FLAT):
         super(SkTree, self).__init__(name)
+        # The tree's own key bits, freed with it:
+        self._keyTable = SkKeyTable()
+        self._hierarchy = hierarchy
         self._keys = []
+        self._nodes = []
+        self._childIndex = {}
+        self._nameIndex = {}
+        self._levels = {}
+
+
+    def buildIndex(self):
+        """(Re)builds the id, path and name indexes over the whole tree"""
+        self._nodes = []
+        self._childIndex = {}
+        self._nameIndex = {}
+        self._levels = {}
+
+        for node in self.iterPreOrder():
+            node.id = len(self._nodes)
+            node._path = None
+            self._nodes.append(node)
+            if node is not self:
+                self._childIndex[(node._parent.id, intern(node.name))] = node
+                self._indexName(node.name, node)
+                if node.label != node.name:
+                    self._indexName(node.label, node)
+
+
+    def _indexName(self, name, node):
+        if name not in self._nameIndex:
+            self._nameIndex[intern(name)] = []
+        self._nameIndex[name].append(node)
+
+
+    def nodeCount(self):
+        return len(self._nodes)
+
+    def getNode(self, nodeId):
+        return self._nodes[nodeId]
+
+    def findPath(self, path):
+        """Returns the node with the given path tuple, or None"""
+        node = self
+        for name in path:
+            node = self._childIndex.get((node.id, name))
+            if node is None:
+                return None
+        return node
+
+    def findNodes(self, name, klass=None):
+        """
+        Returns a list of the nodes whose name or label is `name`, optionally
+        restricted to nodes of type `klass`.
+
+        """
+        nodes = self._nameIndex.get(name, [])
+        if klass is None:
+            return list(nodes)
+        return [n for n in nodes if isinstance(n, klass)]
+
+
+    def levelNodes(self, klass):
+        """Returns the list of nodes of type `klass`, in id order"""
+        if klass not in self._levels:
+            self._levels[klass] = [n for n in self._nodes if type(n) is klass]
+        return self._levels[klass]
+
+
+    def getColumn(self, key, klass):
+        """
+        Returns a list of the values of `key` for the nodes of type `klass`,
+        aligned with `levelNodes(klass)`. Missing values are None.
+
+        """
+        return [n.getData(key) for n in self.levelNodes(klass)]
+
+
+    def topNodes(self, key, k, klass=None, nodes=None):
+        """
+        Returns a list of up to `k` (node, value) pairs, largest value first,
+        for the nodes of type `klass` (functions by default) or for the given
+        sequence of `nodes`. The key may be a raw event or a computed column.
+        Nodes with no value for the key are never included.
+
+        A bounded heap is used, so the cost is O(n log k) rather than that of
+        a full sort of every node at the level.
+
+        """
+        if nodes is None:
+            nodes = self.levelNodes(SkFunctionNode if klass is None else klass)
+        pairs = ((n, n.getData(key)) for n in nodes)
+        return heapq.nlargest(k, (p for p in pairs if p[1] is not None),
+                              key=lambda p: p[1])
+
+    def getHierarchy(self):
+        return self._hierarchy
 
     def appendKey(self, key):
         self._keys.append(key)
@@ -267,7 +636,8 @@ class SkTree(SkNode):
 
     # Formerly getEventName
     def getKey(self, subscript):
-        if subscript < len(self._keys):
+        """Returns the key at `subscript`, or None if there is none (no wrapping)"""
+        if 0 <= subscript < len(self._keys):
             return self._keys[subscript]
 
     def getSubscript(self, key):
@@ -279,11 +649,39 @@ class SkTree(SkNode):
     def hasKeys(self):
         return bool(len(self._keys))
 
+    def isFormula(self, key):
+        return key in self._formulas
+
+    def formulaDependents(self, key):
+        """Returns the labels of the other formulas whose expressions use `key`"""
+        return [k for k, f in self._formulas.iteritems() if k != key and key in f.keyList()]
+
+    def removeFormula(self, key):
+        """
+        Removes a computed column: its formula, its key and every value of it
+        cached anywhere in the tree.
+
+        """
+        del self._formulas[key]
+        self._keys.remove(key)
+        bit = self._keyTable.bit(key)
+        for node in self.iterPreOrder():
+            node._forget(bit)
+        self._keyTable.release(key)
+
 
 class SkCommandNode(SkNode):
     def __init__(self, name):
         super(SkCommandNode, self).__init__(name)
 
+    def _combine(self, key, bit):
+        if (key.endswith(SkCallNode.EXCLUSIVE_SUFFIX) and self._children
+                and isinstance(self._children[0], SkCallNode)):
+            # A sum of its call paths' exclusive counts would just be the
+            # inclusive total under another name, so only call paths have one
+            return None
+        return super(SkCommandNode, self)._combine(key, bit)
+
 
 class SkLibraryNode(SkNode):
 
@@ -300,3 +698,34 @@ class SkFunctionNode(SkNode):
 
         super(SkFunctionNode, self).__init__(name)
 
+
+class SkCallNode(SkNode):
+    """
+    One frame on a call path in a call-graph tree. The node's own samples are
+    stored under the exclusive keys, and the plain (inclusive) keys aggregate
+    those of the node and of all of its callees. The exclusive keys only have
+    values on call-path nodes: commands, and the root, leave them blank.
+
+    """
+    EXCLUSIVE_SUFFIX = '_self'
+
+    def __init__(self, name, dso=None):
+        if not name:
+            name = '[unknown]'
+
+        super(SkCallNode, self).__init__(name)
+        self.dso = dso
+
+    @staticmethod
+    def exclusiveKey(key):
+        return key + SkCallNode.EXCLUSIVE_SUFFIX
+
+    def _combine(self, key, bit):
+        if key.endswith(SkCallNode.EXCLUSIVE_SUFFIX):
+            # Exclusive counts belong to exactly one call path
+            return None
+        total = super(SkCallNode, self)._combine(key, bit) or 0
+        total += self._fetch(self._keyTable.bit(SkCallNode.exclusiveKey(key))) or 0
+        if total!=0:
+            return total
+        return None
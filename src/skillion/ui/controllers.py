@@ -1,12 +1,15 @@
 import math
 
+import numpy
+
 from PyQt4 import QtGui
 from PyQt4 import QtCore
 
-from models import SkSortFilterProxyModel, SkFilter, SkTreeModel
-from skillion.tree import SkLibraryNode, SkFunctionNode
-from widgets import SkTreeViewHeaderContextMenu
+from models import SkSortFilterProxyModel, SkFilter, SkTreeModel, SkHotSpotModel, SkFlatTableModel, SkDisplayTextDelegate
+from skillion.tree import SkTree, SkLibraryNode, SkFunctionNode, SkCallNode, SkFormulaSyntaxError
+from widgets import SkTreeViewHeaderContextMenu, SkHotSpotPanel
 from skillion.io.backend import SkSqliteBackend
+from skillion.search import SkTrigramIndex
 
 class SkController(object):
     TREE_COL_INDEX = 0
@@ -18,13 +21,27 @@ class SkController(object):
     TICK_COL_WIDTH =  56
     DATA_COL_WIDTH =  80
 
+    SEARCH_LIMIT = 1000
+
+    # The range of exponents offered by the axis limit spinners, per base:
+    AXIS_EXPONENT_RANGES = {2: (-1, 64), 10: (-1, 19)}
+
     def __init__(self, view, model=None):
         super(SkController, self).__init__()
 
-        self._model = model
+        self._model = None
         self._view  = view
         self._proxyModel = SkSortFilterProxyModel()
         self._popupMenu  = SkTreeViewHeaderContextMenu(view)
+        self._hotSpotModel = SkHotSpotModel()
+        self._hotSpotPanel = SkHotSpotPanel(view)
+        self._flatModel = None
+        self._flatView  = QtGui.QTableView()
+        self._delegate  = SkDisplayTextDelegate()
+        self._searchBox = QtGui.QLineEdit()
+        self._searchIndex   = None
+        self._searchMatches = []
+        self._searchPos     = 0
         self._dynamicActions = {}
         
         tv = view.uiTreeView
@@ -33,15 +50,25 @@ class SkController(object):
         tv.setSelectionBehavior(QtGui.QAbstractItemView.SelectRows)
         tv.setSortingEnabled(True)
         tv.setUniformRowHeights(True)
+        tv.setItemDelegate(self._delegate)
+        tv.selectionModel().selectionChanged.connect(self.treeSelectionChanged)
 
         self.setupRowFilters()
+        self.setupHotSpotPanel()
+        self.setupFlatView()
+        self.setupSearchBox()
+        self.setupHeaderMenu()
+        self.setupTreeContextMenu()
 
 # Plot clicks are connected with a HACK
 #        self.connectPlotClick()
         self.setupAxisScaleComboBoxes()
         self.setupAxisExtents()
+        self.setupDensityMode()
 
         self.connectFileMenu()
+        self.connectViewMenu()
+        self.connectTreeView()
         
         view.show()
 
@@ -52,12 +79,28 @@ class SkController(object):
         if model is None:
             self.disableMerge()
             return
+        # The plot's canvas is only created once there is something to plot:
+        self._view.mplWidget.createCanvas()
+        if self._model is not None:
+            self.disconnectModel(self._model)
         self._model = model
+        if self._flatModel is not None:
+            # Drop the previous database's table before its tree is replaced:
+            self._flatView.setModel(None)
+            self._flatModel.detach()
+            self._flatModel.deleteLater()
+            self._flatModel = None
         self._proxyModel.setSourceModel(model)
-        self.connectViewMenu()
-        self.connectTreeView()
-        self.connectModelCheckboxes()
+        self._flatModel = SkFlatTableModel(model, self._proxyModel)
+        self._flatView.setModel(self._flatModel)
+        self._searchIndex = SkTrigramIndex(model.getTree())
+        self.connectModel(model)
+        self.setupColumnActions()
         self.setupEventSelectorComboBoxes()
+        self.fitAxesToData()
+        self._hotSpotModel.setTree(model.getTree())
+        self.setupHotSpotLevels()
+        self.setupHotSpotKeys()
         self._view.mplWidget.drawAxes()
         self._view.mplWidget.drawCpiLines()
         self.enableMerge()
@@ -125,9 +168,180 @@ class SkController(object):
 #        print index.internalPointer().getPath()
 
 
+    def treeSelectionChanged(self, selected, deselected):
+        # Ring the selected node's point, if it is plotted:
+        indexes = selected.indexes()
+        if indexes:
+            skNode = self._proxyModel.mapToSource(indexes[0]).internalPointer()
+            self._view.mplWidget.highlightPoint(skNode.getId())
+
+
+    def selectNode(self, skNode):
+        """
+        Selects the given node in the tree view, expanding its ancestors and
+        scrolling it into view. Returns False if the node is filtered out.
+
+        """
+        smi = self._model.indexOfNode(skNode)
+        pmi = self._proxyModel.mapFromSource(smi)
+        if not pmi.isValid():
+            return False
+        self.plotClicked(smi)
+        tv = self._view.uiTreeView
+        parent = pmi.parent()
+        while parent.isValid():
+            tv.expand(parent)
+            parent = parent.parent()
+        tv.scrollTo(pmi)
+        return True
+
+
+    def setupSearchBox(self):
+        sb = self._searchBox
+        sb.setToolTip("Find functions, modules or commands by name, or by path (e.g. 'ls/libc'); "
+                      "press Enter for the next match")
+        if hasattr(sb, 'setPlaceholderText'):
+            sb.setPlaceholderText("Search...")
+        QtCore.QObject.connect(sb, QtCore.SIGNAL('textChanged(QString)'), self.search)
+        QtCore.QObject.connect(sb, QtCore.SIGNAL('returnPressed()'), self.searchNext)
+
+
+    def search(self, text):
+        """Reveals the first match for `text` in the tree as it is typed"""
+        if self._searchIndex is None:
+            return
+        self._searchMatches = self._searchIndex.search(unicode(text), SkController.SEARCH_LIMIT)
+        self._searchPos = -1
+        self.searchNext()
+
+
+    def searchNext(self):
+        """Reveals the next match that isn't filtered out, wrapping around"""
+        matches = self._searchMatches
+        bar = self._view.uiStatusBar
+        if not matches:
+            bar.showMessage("No matches" if self._searchBox.text() else "")
+            return
+        for i in range(1, len(matches)+1):
+            pos = (self._searchPos + i) % len(matches)
+            if self.selectNode(matches[pos]):
+                self._searchPos = pos
+                more = '+' if len(matches) == SkController.SEARCH_LIMIT else ''
+                bar.showMessage("Match %d of %d%s" % (pos+1, len(matches), more))
+                return
+        bar.showMessage("%d matches, all hidden by row filters" % len(matches))
+
+
+    def setupFlatView(self):
+        """Puts the tree view and a flat table of all functions in tabs"""
+        v = self._view
+        tabs = QtGui.QTabWidget(v.splitter)
+        v.splitter.insertWidget(0, tabs)
+
+        # The tree tab has the search box above the tree:
+        page = QtGui.QWidget()
+        layout = QtGui.QVBoxLayout(page)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self._searchBox)
+        layout.addWidget(v.uiTreeView)
+        tabs.addTab(page, 'Tree')
+        tabs.addTab(self._flatView, 'All functions')
+        self._tabs = tabs
+        self._treePage = page
+
+        fv = self._flatView
+        fv.setSelectionMode(QtGui.QAbstractItemView.SingleSelection)
+        fv.setSelectionBehavior(QtGui.QAbstractItemView.SelectRows)
+        fv.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
+        fv.setSortingEnabled(True)
+        fv.setWordWrap(False)
+        fv.setItemDelegate(self._delegate)
+        # Fixed row heights spare the view from measuring every row:
+        fv.verticalHeader().setResizeMode(QtGui.QHeaderView.Fixed)
+        fv.verticalHeader().setDefaultSectionSize(fv.fontMetrics().height() + 4)
+        fv.horizontalHeader().setDefaultSectionSize(SkController.DATA_COL_WIDTH)
+        QtCore.QObject.connect(fv, QtCore.SIGNAL('doubleClicked(QModelIndex)'), self.flatViewActivated)
+
+
+    def flatViewActivated(self, index):
+        """Shows the function double-clicked in the flat table in the tree"""
+        if index.isValid():
+            self._tabs.setCurrentWidget(self._treePage)
+            self.selectNode( self._flatModel.getNode(index.row()) )
+
+
+    def setupHotSpotPanel(self):
+        v = self._view
+        hsp = self._hotSpotPanel
+        hsp.tableView.setModel(self._hotSpotModel)
+        hsp.levelSelector.addItems( [name for klass, name in self._hotSpotModel.levels()] )
+        v.addDockWidget(QtCore.Qt.BottomDockWidgetArea, hsp)
+        hsp.hide()
+        v.uiMenuView.addAction(hsp.toggleViewAction())
+        QtCore.QObject.connect(hsp.levelSelector, QtCore.SIGNAL('currentIndexChanged(int)'), self.updateHotSpots)
+        QtCore.QObject.connect(hsp.keySelector,   QtCore.SIGNAL('currentIndexChanged(int)'), self.updateHotSpots)
+        QtCore.QObject.connect(hsp.countSpinner,  QtCore.SIGNAL('valueChanged(int)'),        self.updateHotSpots)
+        QtCore.QObject.connect(hsp.tableView,     QtCore.SIGNAL('activated(QModelIndex)'),   self.hotSpotActivated)
+        QtCore.QObject.connect(hsp.tableView,     QtCore.SIGNAL('clicked(QModelIndex)'),     self.hotSpotActivated)
+
+
+    def setupHotSpotLevels(self):
+        """Offers the levels of the current tree's hierarchy"""
+        hsp = self._hotSpotPanel
+        hsp.levelSelector.blockSignals(True)
+        hsp.levelSelector.clear()
+        hsp.levelSelector.addItems( [name for klass, name in self._hotSpotModel.levels()] )
+        hsp.levelSelector.setCurrentIndex(0)
+        hsp.levelSelector.blockSignals(False)
+
+
+    def setupHotSpotKeys(self):
+        hsp = self._hotSpotPanel
+        key = hsp.keySelector.currentText()
+        hsp.keySelector.blockSignals(True)
+        hsp.keySelector.clear()
+        hsp.keySelector.addItems( self._model.getTree().getKeyList() )
+        hsp.keySelector.setCurrentIndex( max(0, hsp.keySelector.findText(key)) )
+        hsp.keySelector.blockSignals(False)
+        self.updateHotSpots()
+
+
+    def updateHotSpots(self, *args):
+        hsp = self._hotSpotPanel
+        self._hotSpotModel.query( str(hsp.keySelector.currentText()),
+                                  hsp.countSpinner.value(),
+                                  hsp.levelSelector.currentIndex() )
+        hsp.tableView.resizeColumnsToContents()
+
+
+    def hotSpotActivated(self, index):
+        if index.isValid():
+            self.selectNode( self._hotSpotModel.getNode(index.row()) )
+
+
     def connectTreeView(self):
         QtCore.QObject.connect(self._view.uiTreeView, QtCore.SIGNAL('expanded(QModelIndex)'), self.sizeTreeView)
-        QtCore.QObject.connect(self._model, QtCore.SIGNAL('modelReset()'), self.modelReset)
+
+
+    # The signals of a model, connected by connectModel() when it is set and
+    # disconnected by disconnectModel() when another replaces it, so that
+    # opening one file after another doesn't stack up handlers:
+    def _modelSignals(self):
+        return [('modelReset()',                                 self.modelReset),
+                ('columnsInserted(QModelIndex,int,int)',         self.columnsInserted),
+                ('columnsAboutToBeRemoved(QModelIndex,int,int)', self.columnsAboutToBeRemoved),
+                ('columnsRemoved(QModelIndex,int,int)',          self.columnsRemoved),
+                ('dataChanged(QModelIndex,QModelIndex)',         self.checkBoxToggle)]
+
+
+    def connectModel(self, model):
+        for signal, slot in self._modelSignals():
+            QtCore.QObject.connect(model, QtCore.SIGNAL(signal), slot)
+
+
+    def disconnectModel(self, model):
+        for signal, slot in self._modelSignals():
+            QtCore.QObject.disconnect(model, QtCore.SIGNAL(signal), slot)
 
 
     def sizeTreeView(self, index):
@@ -140,17 +354,21 @@ class SkController(object):
 
 
     def _addColumnAction(self, col):
-        label = self._model.headerData(col, None, QtCore.Qt.DisplayRole)
         action = QtGui.QAction(self._view)
+        self._numberColumnAction(action, col)
+        action.setCheckable(True)
+        action.setChecked(True)
+        action.toggled.connect(lambda:self.setColumnVisibility(action))
+        self._view.menuShow_hide_columns.addAction(action)        
+
+
+    def _numberColumnAction(self, action, col):
+        label = self._model.headerData(col, None, QtCore.Qt.DisplayRole)
         if col<10:
             action.setText("Show column &%d (%s)" % (col,label))
         else:
             action.setText("Show column %d (%s)" % (col,label))
-        action.setCheckable(True)
-        action.setChecked(True)
         action.setData(col)
-        action.toggled.connect(lambda:self.setColumnVisibility(action))
-        self._view.menuShow_hide_columns.addAction(action)        
 
 
     def _addRowAction(self, filter_):
@@ -168,10 +386,21 @@ class SkController(object):
         v = self._view
         QtCore.QObject.connect(v.actionOpen, QtCore.SIGNAL('triggered()'), self.openFile)
 
+        action = QtGui.QAction(v)
+        action.setText("Open &call graph...")
+        action.setStatusTip("Open a database as a caller/callee tree built from its callchains")
+        action.triggered.connect(lambda:self.openFile(callgraph=True))
+        v.uiMenuFile.insertAction(v.actionMerge, action)
 
-    def openFile(self):
+
+    def openFile(self, callgraph=False):
         fname = QtGui.QFileDialog.getOpenFileName(self._view, 'Open File', '.')
-        rawDataTree = SkSqliteBackend.buildSkTree(fname)
+        if not fname:
+            return
+        if callgraph:
+            rawDataTree = SkSqliteBackend.buildCallTree(str(fname))
+        else:
+            rawDataTree = SkSqliteBackend.buildSkTree(fname)
         self.setModel( SkTreeModel(rawDataTree) )
 
 
@@ -182,9 +411,6 @@ class SkController(object):
         QtCore.QObject.connect(v.actionShow_relocation_stubs, QtCore.SIGNAL('triggered()'), self.updateShowFlags)
         QtCore.QObject.connect(v.actionShow_reserved_symbols, QtCore.SIGNAL('triggered()'), self.updateShowFlags)
         QtCore.QObject.connect(v.actionAdd_computed_column,   QtCore.SIGNAL('triggered()'), self.addComputedColumn)
-        for col in range(3, self._model.columnCount()):
-            self._addColumnAction(col)
-
         QtCore.QObject.connect(v.actionHide_column,           QtCore.SIGNAL('triggered()'), self.hideThisColumn)
         QtCore.QObject.connect(v.uiTreeView, QtCore.SIGNAL('customContextMenuRequested(QPoint)'), self.showTreeContextMenu)
         v.uiTreeView.header().setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
@@ -192,6 +418,15 @@ class SkController(object):
 
 
 
+    def setupColumnActions(self):
+        """Offers a show/hide action for each data column of the current model"""
+        menu = self._view.menuShow_hide_columns
+        for action in menu.actions():
+            menu.removeAction(action)
+        for col in range(SkTreeModel.NONDATA_COLUMN_COUNT, self._model.columnCount()):
+            self._addColumnAction(col)
+
+
     def setColumnVisibility(self, action):
         assert isinstance(action, QtGui.QAction)
         column = action.data().toInt()[0]
@@ -221,43 +456,185 @@ class SkController(object):
         qstr,ok = QtGui.QInputDialog.getText(self._view, 'Input Formula', 'Formula:')
         if not ok:
             return False
-        # FIXME: dumb ad-hoc way of checking that adding the formula succeeded
-        cc = self._model.columnCount()
-        self._model.addColumnFormula(str(qstr))
-        if cc+1 == self._model.columnCount():
-            self._addColumnAction(cc)
+        try:
+            if not self._model.addColumnFormula(str(qstr)):
+                return self.warn("There is already a column with that label.")
+        except SkFormulaSyntaxError as e:
+            return self.warn("Bad formula '{}': {}.".format(qstr, e))
+        return True
 
 
-    def connectModelCheckboxes(self):
-        m = self._model
-        QtCore.QObject.connect(m, QtCore.SIGNAL('dataChanged(QModelIndex,QModelIndex)'), self.checkBoxToggle)
+    def setupHeaderMenu(self):
+        action = QtGui.QAction(self._view)
+        action.setText("&Remove computed column")
+        action.triggered.connect(self.removeThisColumn)
+        self._popupMenu.addAction(action)
+        self._removeColumnAction = action
+
+
+    def removeThisColumn(self):
+        column = self._view.uiTreeView.header().logicalIndexAt(self._popupCoords)
+        if not self._model.removeColumnFormula(column):
+            self.warn("Only computed columns that no other formula uses can be removed.")
+
+
+    def columnsInserted(self, parent, first, last):
+        """A computed column has been added: make it available everywhere"""
+        v = self._view
+        for col in range(first, last+1):
+            key = self._model.headerData(col, QtCore.Qt.Horizontal, QtCore.Qt.DisplayRole)
+            v.xAxisEvent.addItem(key)
+            v.yAxisEvent.addItem(key)
+            self._hotSpotPanel.keySelector.addItem(key)
+            self._addColumnAction(col)
+            v.uiTreeView.setColumnWidth(col, SkController.DATA_COL_WIDTH)
+
+
+    def columnsAboutToBeRemoved(self, parent, first, last):
+        v = self._view
+        actions = v.menuShow_hide_columns.actions()
+        for col in range(last, first-1, -1):
+            key = self._model.headerData(col, QtCore.Qt.Horizontal, QtCore.Qt.DisplayRole)
+            for combo in (v.xAxisEvent, v.yAxisEvent, self._hotSpotPanel.keySelector):
+                i = combo.findText(key)
+                if i >= 0:
+                    combo.removeItem(i)
+            v.menuShow_hide_columns.removeAction(actions[col-self._model.NONDATA_COLUMN_COUNT])
+
+
+    def columnsRemoved(self, parent, first, last):
+        # Later columns have moved down:
+        actions = self._view.menuShow_hide_columns.actions()
+        for i in range(first-self._model.NONDATA_COLUMN_COUNT, len(actions)):
+            self._numberColumnAction(actions[i], i+self._model.NONDATA_COLUMN_COUNT)
 
 
     def checkBoxToggle(self, topLeftIndex, bottomRightIndex):
-        assert topLeftIndex == bottomRightIndex, "Indices cannot differ here"
-        index = topLeftIndex
-        if not index.isValid():
+        """
+        Plots or unplots the nodes in a range of sibling rows whose check
+        marks have changed: one row when a box is clicked, or a whole run of
+        them from `SkTreeModel.setNodesChecked()`.
+
+        """
+        if not topLeftIndex.isValid():
             return None
+        if topLeftIndex.column() > SkTreeModel.PLOT_COLUMN or bottomRightIndex.column() < SkTreeModel.PLOT_COLUMN:
+            return None
+
+        parent = topLeftIndex.internalPointer().parent()
+        nodes = [parent.getChild(row) for row in range(topLeftIndex.row(), bottomRightIndex.row()+1)]
+        self.plotNodes([n for n in nodes if n.isChecked()])
+        self.unplotNodes([n for n in nodes if not n.isChecked()])
+
 
-#        skNode = self._proxyModel.mapToSource(index).internalPointer()
-        skNode = index.internalPointer()
+    def _eventArrays(self, nodes):
+        """
+        Returns NumPy arrays of the selected x and y events of the given nodes,
+        and a boolean array of which nodes have a (non-zero) value for both.
+
+        """
         xev = str(self._view.xAxisEvent.currentText())
         yev = str(self._view.yAxisEvent.currentText())
+        # None becomes NaN, which fails every comparison:
+        x = numpy.array([n.getData(xev) for n in nodes], dtype=float)
+        y = numpy.array([n.getData(yev) for n in nodes], dtype=float)
+        return x, y, (x > 0) & (y > 0)
 
-        x = skNode.getData(xev)
-        y = skNode.getData(yev)
 
-        if not x or not y:
+    def plotNodes(self, nodes):
+        """Plots the given (checked) nodes as a batch, unchecking any that can't be"""
+        if not nodes:
+            return
+        x, y, ok = self._eventArrays(nodes)
+        missing = [n for n, has in zip(nodes, ok) if not has]
+        for skNode in missing:
             skNode.setChecked(False)
-            return self.warn("Symbol '{}' has no value for checked plot event '{}'.".format(skNode.label, yev if x else xev))
 
-        # HACK: Work around not being able to get QtCore.pyqtSignal() to work in SkPlotWidget
-        if skNode.isChecked():
-            r,g,b = self._view.mplWidget.addPoint( skNode.getPath(), x, y, lambda: self.plotClicked(index) )
-            skNode.setColor( QtGui.QColor(int(255*r),int(255*g),int(255*b)) )
-        else:
+        points = []
+        for i in numpy.flatnonzero(ok):
+            skNode = nodes[i]
+            smi = self._model.indexOfNode(skNode, SkTreeModel.PLOT_COLUMN)
+            points.append( (skNode.getId(), x[i], y[i], lambda smi=smi: self.plotClicked(smi), skNode.getPath()) )
+        colors = self._view.mplWidget.addPoints(points)
+        for point, (r,g,b) in zip(points, colors):
+            self._model.getTree().getNode(point[0]).setColor( QtGui.QColor(int(255*r),int(255*g),int(255*b)) )
+
+        if len(missing) == 1:
+            skNode = missing[0]
+            xev = str(self._view.xAxisEvent.currentText())
+            yev = str(self._view.yAxisEvent.currentText())
+            self.warn("Symbol '{}' has no value for checked plot event '{}'.".format(skNode.label, xev if not skNode.getData(xev) else yev))
+        elif missing and len(missing) == len(nodes):
+            self.warn("None of the {} symbols has values for both plot events.".format(len(missing)))
+
+
+    def unplotNodes(self, nodes):
+        for skNode in nodes:
             skNode.setColor( None )
-            self._view.mplWidget.removePoint( skNode.getPath() )
+        self._view.mplWidget.removePoints([skNode.getId() for skNode in nodes])
+
+
+    def setupTreeContextMenu(self):
+        menu = QtGui.QMenu(self._view)
+        self._treeMenu = menu
+        self._treeMenuIndex = QtCore.QModelIndex()
+        self._plotChildrenAction = menu.addAction("Plot &children", lambda: self.plotSelection('children'))
+        self._plotBelowAction    = menu.addAction("Plot &functions below", lambda: self.plotSelection('below'))
+        menu.addAction("Plot &all visible functions", lambda: self.plotSelection('all'))
+        menu.addSeparator()
+        self._unplotChildrenAction = menu.addAction("&Unplot children", lambda: self.plotSelection('children', False))
+        menu.addAction("C&lear plot", self.clearPlot)
+
+
+    def _leafClass(self):
+        tree = self._model.getTree()
+        return SkCallNode if tree.getHierarchy() == SkTree.HIERARCHY_CALLGRAPH else SkFunctionNode
+
+
+    def plotSelection(self, which, checked=True):
+        """
+        Checks (or unchecks) a set of nodes in one go: the visible children of
+        the node the context menu was opened on, the visible functions below
+        it, or every visible function. Nodes lacking a value for either plot
+        event are skipped up front, and the model reports the change as one
+        dataChanged() per run of siblings, so plotting the functions of a
+        library is a single batch and a single render.
+
+        """
+        if self._model is None:
+            return
+        pmi = self._treeMenuIndex
+        skNode = self._proxyModel.mapToSource(pmi).internalPointer() if pmi.isValid() else None
+        if which == 'children':
+            if skNode is None:
+                return
+            nodes = [skNode.getChild(i) for i in range(skNode.childCount())]
+        elif which == 'below':
+            if skNode is None:
+                return
+            klass = self._leafClass()
+            nodes = [n for n in skNode.iterPreOrder() if type(n) is klass and n is not skNode]
+        else:
+            klass = self._leafClass()
+            nodes = self._model.getTree().levelNodes(klass)
+
+        isVisible = self._proxyModel.isVisible
+        nodes = [n for n in nodes if isVisible(n) and n.isChecked() != checked]
+        if checked and nodes:
+            ok = self._eventArrays(nodes)[2]
+            skipped = len(nodes) - int(ok.sum())
+            nodes = [n for n, has in zip(nodes, ok) if has]
+            if skipped:
+                self._view.uiStatusBar.showMessage("{} nodes without values for both plot events were not plotted".format(skipped))
+        self._model.setNodesChecked(nodes, checked)
+
+
+    def clearPlot(self):
+        """Unchecks every checked node, whatever its level or filter state"""
+        if self._model is None:
+            return
+        nodes = [n for n in self._model.getTree().iterPreOrder() if n.isChecked()]
+        self._model.setNodesChecked(nodes, False)
 
 
     def warn(self, msg, level=QtGui.QMessageBox.Warning):
@@ -300,17 +677,10 @@ class SkController(object):
         lo.setPrefix( pfx )
         hi.setPrefix( pfx )
 
-        if base==2:
-            lo.setMinimum(-1)
-            lo.setMaximum(36)
-            hi.setMinimum(1)
-            hi.setMaximum(37)
-
-        elif base==10:
-            lo.setMinimum(-1)
-            lo.setMaximum(10)
-            hi.setMinimum(0)
-            hi.setMaximum(11)
+        if base in SkController.AXIS_EXPONENT_RANGES:
+            emin, emax = SkController.AXIS_EXPONENT_RANGES[base]
+            lo.setRange(emin, emax-1)
+            hi.setRange(emin+1, emax)
 
         if draw:
             lo_lin = lo_base**lo_exp
@@ -381,12 +751,13 @@ class SkController(object):
 
 
     def modelReset(self):
-        """When the model is reset (after adding or deleting a computed column),
-        the only thing we really need to do is add or delete items from the
-        X/Y picklists"""
+        """When the model is reset, the only thing we really need to do is
+        repopulate the X/Y picklists. Computed columns are added and removed
+        without a reset; see columnsInserted() and columnsAboutToBeRemoved()"""
         # FIXME: What about when the plot includes a computed column that's
         # just been deleted?
         self.setupEventSelectorComboBoxes(reset=True)
+        self.setupHotSpotKeys()
 
 
     def setupAxisExtents(self):
@@ -404,8 +775,97 @@ class SkController(object):
         QtCore.QObject.connect(v.xAxisAuto, QtCore.SIGNAL('toggled(bool)'), self.setXAxisAuto)
         QtCore.QObject.connect(v.yAxisAuto, QtCore.SIGNAL('toggled(bool)'), self.setYAxisAuto)
         QtCore.QObject.connect(v.cpiLineButton, QtCore.SIGNAL('clicked()'), p.drawCpiLines)
+        QtCore.QObject.connect(v.xAxisEvent, QtCore.SIGNAL('currentIndexChanged(int)'), self.fitAxesToData)
+        QtCore.QObject.connect(v.yAxisEvent, QtCore.SIGNAL('currentIndexChanged(int)'), self.fitAxesToData)
+
+        action = QtGui.QAction(v)
+        action.setText("&Fit axes to data")
+        action.setStatusTip("Set the axis limits to enclose every visible function")
+        action.triggered.connect(self.fitAxesToData)
+        v.uiMenuView.addAction(action)
 
 
+    def fitAxesToData(self, *args):
+        """
+        Sets each axis' limits to the powers of its base that enclose the
+        values of every visible function (or call-path node), updating the
+        spinners quietly and redrawing once.
+
+        """
+        columns = self._plotColumns()
+        if columns is None:
+            return
+        v = self._view
+        limits = []
+        for values, scale, lo, hi in ((columns[0], v.xAxisScale, v.xAxisLo, v.xAxisHi),
+                                      (columns[1], v.yAxisScale, v.yAxisLo, v.yAxisHi)):
+            values = values[values > 0]
+            if not len(values):
+                limits.append(None)
+                continue
+            base = 2 if str(scale.currentText()) == 'log2' else 10
+            loExp = max(lo.minimum(), int(math.floor(math.log(values.min(), base))))
+            hiExp = min(hi.maximum(), max(loExp+1, int(math.ceil(math.log(values.max(), base)))))
+            for spinner, exponent in ((lo, loExp), (hi, hiExp)):
+                spinner.blockSignals(True)
+                spinner.setValue(exponent)
+                spinner.blockSignals(False)
+            limits.append((base**loExp, base**hiExp))
+        v.mplWidget.setLimits(limits[0], limits[1])
+
+
+
+    def setupDensityMode(self):
+        v = self._view
+        action = QtGui.QAction(v)
+        action.setText("&Plot everything")
+        action.setStatusTip("Show every visible function on the plot, as a density map where they are crowded")
+        action.setCheckable(True)
+        action.toggled.connect(self.updateDensity)
+        v.uiMenuView.addAction(action)
+        self._densityAction = action
+        QtCore.QObject.connect(v.xAxisEvent, QtCore.SIGNAL('currentIndexChanged(int)'), self.updateDensity)
+        QtCore.QObject.connect(v.yAxisEvent, QtCore.SIGNAL('currentIndexChanged(int)'), self.updateDensity)
+        self._proxyModel.filtersChanged.connect(self.updateDensity)
+
+
+    def _plotColumns(self):
+        """
+        Returns NumPy arrays of the selected x and y events of every visible
+        leaf node (function, or call-path node) that has both, or None if
+        there is no model or the event selectors are being repopulated.
+
+        """
+        if self._model is None:
+            return None
+        tree = self._model.getTree()
+        xev = str(self._view.xAxisEvent.currentText())
+        yev = str(self._view.yAxisEvent.currentText())
+        keys = tree.getKeyList()
+        if xev not in keys or yev not in keys:
+            return None
+        klass = self._leafClass()
+        isVisible = self._proxyModel.isVisible
+        xs = tree.getColumn(xev, klass)
+        ys = tree.getColumn(yev, klass)
+        points = [(x, y) for n, x, y in zip(tree.levelNodes(klass), xs, ys)
+                  if x and y and isVisible(n)]
+        if not points:
+            return numpy.empty(0), numpy.empty(0)
+        x, y = numpy.array(points, dtype=float).T
+        return x, y
+
+
+    def updateDensity(self, *args):
+        """Feeds the plot the x/y events of every visible leaf node, if asked to"""
+        p = self._view.mplWidget
+        if not self._densityAction.isChecked():
+            p.setDensityData(None, None)
+            return
+        columns = self._plotColumns()
+        if columns is not None:
+            p.setDensityData(*columns)
+
 
     def setXAxisAuto(self, enabled, draw=True):
         auto = bool(enabled)
@@ -429,12 +889,23 @@ class SkController(object):
 
 
     def showTreeContextMenu(self, wxy):
+        if self._model is None:
+            return
         index = self._view.uiTreeView.indexAt(wxy)
-        print "Body ctx", wxy, index.row(), index.column()
+        self._treeMenuIndex = index
+        hasChildren = index.isValid() and self._proxyModel.rowCount(index.sibling(index.row(), 0)) > 0
+        self._plotChildrenAction.setEnabled(hasChildren)
+        self._plotBelowAction.setEnabled(hasChildren)
+        self._unplotChildrenAction.setEnabled(hasChildren)
+        self._treeMenu.exec_(self._view.uiTreeView.mapToGlobal(wxy))
 
 
     def showTreeHeaderMenu(self, wxy):
         self._popupCoords = wxy
+        tree = self._model.getTree()
+        col = self._view.uiTreeView.header().logicalIndexAt(wxy) - self._model.NONDATA_COLUMN_COUNT
+        key = tree.getKey(col) if col >= 0 else None
+        self._removeColumnAction.setEnabled(key is not None and tree.isFormula(key))
         self._popupMenu.exec_(self._view.uiTreeView.mapToGlobal(wxy))
         
         
@@ -5,9 +5,31 @@ Created on Aug 21, 2013
 '''
 
 import os
-from PyQt4 import uic
+from PyQt4 import QtGui
 
-base, form = uic.loadUiType( os.path.dirname(os.path.realpath(__file__))+"/skillion.ui")
+UI_FILE = os.path.dirname(os.path.realpath(__file__))+"/skillion.ui"
+
+
+def _loadUiType():
+    """
+    Returns the (form, base) classes of the main window, like
+    uic.loadUiType(), but from the module precompiled by 'make ui' if it is
+    up to date, which saves parsing the XML and generating the code anew on
+    every launch.
+
+    """
+    try:
+        from skillion.ui import skillion_ui
+        compiled = os.path.splitext(skillion_ui.__file__)[0] + '.py'
+        if os.path.getmtime(compiled) >= os.path.getmtime(UI_FILE):
+            return skillion_ui.Ui_uiMainWindow, QtGui.QMainWindow
+    except (ImportError, OSError):
+        pass
+    from PyQt4 import uic
+    return uic.loadUiType(UI_FILE)
+
+
+base, form = _loadUiType()
 class SkMainWindow(base, form):
     def __init__(self, parent=None):
         super(base, self).__init__(parent)
@@ -5,7 +5,7 @@ import re
 from PyQt4 import QtCore
 from PyQt4 import QtGui
 
-from skillion.tree import SkTree, SkColumnFormula, SkCommandNode, SkLibraryNode, SkFunctionNode
+from skillion.tree import SkTree, SkColumnFormula, SkCommandNode, SkLibraryNode, SkFunctionNode, SkCallNode
 
 
 class SkTreeModel(QtCore.QAbstractItemModel):
@@ -14,6 +14,8 @@ class SkTreeModel(QtCore.QAbstractItemModel):
     PLOT_COLUMN = 2
     # Expandable tree + node type + check mark (for plotting)
     NONDATA_COLUMN_COUNT = 3
+    # Data cells' formatted text, drawn by SkDisplayTextDelegate:
+    DISPLAY_TEXT_ROLE = QtCore.Qt.UserRole + 1
 
     def __init__(self, arg, parent=None):
         super(SkTreeModel, self).__init__(parent)
@@ -25,6 +27,10 @@ class SkTreeModel(QtCore.QAbstractItemModel):
         else:
             raise Exception("Type error calling constructor")
 
+        self._locale = QtCore.QLocale()
+        self._displayCache = {}
+        self.modelReset.connect(self.invalidateDisplayCache)
+
 
     def index(self, row, col, parent):
         childSkNode = self._getSkNode(parent).getChild(row)
@@ -58,32 +64,62 @@ class SkTreeModel(QtCore.QAbstractItemModel):
             return None
 
         col = index.column()
-        skNode = index.internalPointer()
 
         if role == QtCore.Qt.DisplayRole:
+            if col >= SkTreeModel.NONDATA_COLUMN_COUNT:
+                skNode = index.internalPointer()
+                return skNode.getData(self._root.getKey(col-SkTreeModel.NONDATA_COLUMN_COUNT))
             if col == SkTreeModel.TREE_COLUMN:
-                return skNode.label
+                return index.internalPointer().label
             if col == SkTreeModel.TYPE_COLUMN:
                 return '[ERROR]'
-            if col == SkTreeModel.PLOT_COLUMN:
-                return None
-            else:
-                evtName = self._root.getKey(col-SkTreeModel.NONDATA_COLUMN_COUNT)
-                return skNode.getData(evtName)
+            return None
+
+        if role == SkTreeModel.DISPLAY_TEXT_ROLE:
+            if col >= SkTreeModel.NONDATA_COLUMN_COUNT:
+                return self.displayText(col, index.internalPointer())
+            return None
 
         if role == QtCore.Qt.TextAlignmentRole:
-            if col == SkTreeModel.PLOT_COLUMN:
-                return QtCore.Qt.AlignCenter
             if col >= SkTreeModel.NONDATA_COLUMN_COUNT:
                 return QtCore.Qt.AlignRight
+            if col == SkTreeModel.PLOT_COLUMN:
+                return QtCore.Qt.AlignCenter
+            return None
+
+        if col != SkTreeModel.PLOT_COLUMN:
+            return None
 
-        if role == QtCore.Qt.CheckStateRole and col == SkTreeModel.PLOT_COLUMN:
+        skNode = index.internalPointer()
+        if role == QtCore.Qt.CheckStateRole:
             return QtCore.Qt.Checked if skNode.isChecked() else QtCore.Qt.Unchecked
 
-        if role == QtCore.Qt.DecorationRole and col == SkTreeModel.PLOT_COLUMN and skNode.isChecked():
+        if role == QtCore.Qt.DecorationRole and skNode.isChecked():
             return skNode.getColor()
 
 
+    def displayText(self, col, skNode):
+        """
+        Returns the formatted value of the node in data column `col`. Values
+        are formatted once, as Qt would format them, and kept in a list per
+        column indexed by node id, so repainting a cell is two list lookups.
+
+        """
+        cache = self._displayCache.get(col)
+        if cache is None:
+            cache = [None] * self._root.nodeCount()
+            self._displayCache[col] = cache
+        text = cache[skNode.id]
+        if text is None:
+            value = skNode.getData(self._root.getKey(col-SkTreeModel.NONDATA_COLUMN_COUNT))
+            text = '' if value is None else self._locale.toString(value)
+            cache[skNode.id] = text
+        return text
+
+
+    def invalidateDisplayCache(self, *args):
+        self._displayCache = {}
+
 
     def flags(self, index):
         if not index.isValid():
@@ -114,6 +150,8 @@ class SkTreeModel(QtCore.QAbstractItemModel):
     def headerData(self, section, orientation, role):
         if role == QtCore.Qt.DisplayRole:
             if section == SkTreeModel.TREE_COLUMN:
+                if self._root.getHierarchy() == SkTree.HIERARCHY_CALLGRAPH:
+                    return "Command/Call path"
                 return "Command/Module/Function"
             if section == SkTreeModel.TYPE_COLUMN:
                 return "Type"
@@ -124,16 +162,82 @@ class SkTreeModel(QtCore.QAbstractItemModel):
 
 
     def addColumnFormula(self, string):
+        """
+        Adds a computed column at the end. Only the new column is inserted, so
+        views keep their expansion state, selection and sort order, and values
+        are only computed as the new column's cells are shown.
+
+        Returns False if the formula's label is already a column.
+
+        """
+        formula = SkColumnFormula(string, self._root.getKeyList())
+        if formula.label() in self._root.getKeyList():
+            return False
         # If there are 3 nondata columns and 4 data columns, the column count
         # before we add the new column is 7 (cc); so 7 is the right number for
         # the new column index.
-#        cc = self.columnCount()
-#        self.beginInsertColumns(QtCore.QModelIndex(), cc, cc)
-        self.beginResetModel()
-        formula = SkColumnFormula(string, self._root.getKeyList())
+        cc = self.columnCount()
+        self.beginInsertColumns(QtCore.QModelIndex(), cc, cc)
         self._root.setFormula(formula.label(), formula)
-#        self.endInsertColumns()
-        self.endResetModel()
+        self._displayCache.pop(cc, None)
+        self.endInsertColumns()
+        return True
+
+
+    def removeColumnFormula(self, col):
+        """
+        Removes the computed column `col`. Returns False, leaving the column
+        in place, if it is not a computed column or other formulas use it.
+
+        """
+        if col < SkTreeModel.NONDATA_COLUMN_COUNT:
+            return False
+        key = self._root.getKey(col-SkTreeModel.NONDATA_COLUMN_COUNT)
+        if key is None or not self._root.isFormula(key):
+            return False
+        if self._root.formulaDependents(key):
+            return False
+        self.beginRemoveColumns(QtCore.QModelIndex(), col, col)
+        self._root.removeFormula(key)
+        # Columns after the removed one have moved:
+        self.invalidateDisplayCache()
+        self.endRemoveColumns()
+        return True
+
+
+    def setNodesChecked(self, nodes, checked):
+        """
+        Checks (or unchecks) the plot boxes of the given nodes, emitting one
+        dataChanged() per run of adjacent siblings rather than one per node.
+
+        """
+        changed = {}
+        for skNode in nodes:
+            if skNode.isChecked() != checked and skNode.parent() is not None:
+                skNode.setChecked(checked)
+                changed.setdefault(skNode.parent(), set()).add(skNode.id)
+
+        col = SkTreeModel.PLOT_COLUMN
+        for parent, ids in changed.iteritems():
+            rows = [row for row in range(parent.childCount()) if parent.getChild(row).id in ids]
+            start = 0
+            for i in range(1, len(rows)+1):
+                if i == len(rows) or rows[i] != rows[i-1]+1:
+                    first, last = rows[start], rows[i-1]
+                    self.dataChanged.emit(self.createIndex(first, col, parent.getChild(first)),
+                                          self.createIndex(last,  col, parent.getChild(last)))
+                    start = i
+
+
+    def indexOfNode(self, skNode, col=0):
+        """Returns the source model index of the given node"""
+        if skNode is None or skNode is self._root:
+            return QtCore.QModelIndex()
+        return self.createIndex(skNode.parent().indexOf(skNode), col, skNode)
+
+
+    def getTree(self):
+        return self._root
 
 
     def _getSkNode(self, index):
@@ -144,6 +248,302 @@ class SkTreeModel(QtCore.QAbstractItemModel):
 
 
 
+class SkDisplayTextDelegate(QtGui.QStyledItemDelegate):
+    """
+    Draws data cells with the text their model keeps formatted under
+    DISPLAY_TEXT_ROLE, so the models' DisplayRole can stay the numeric value
+    while a repaint doesn't format it again.
+
+    """
+    def paint(self, painter, option, index):
+        text = index.data(SkTreeModel.DISPLAY_TEXT_ROLE)
+        if not text.isValid():
+            return super(SkDisplayTextDelegate, self).paint(painter, option, index)
+        opt = QtGui.QStyleOptionViewItemV4(option)
+        self.initStyleOption(opt, index)
+        opt.text = text.toString()
+        style = opt.widget.style() if opt.widget is not None else QtGui.QApplication.style()
+        style.drawControl(QtGui.QStyle.CE_ItemViewItem, opt, painter, opt.widget)
+
+
+
+class SkHotSpotModel(QtCore.QAbstractTableModel):
+    """
+    A flat table of the top K nodes at one level of the hierarchy, ranked by
+    a raw or computed key. The ranking itself is done by `SkTree.topNodes()`.
+
+    The leading columns give the node's label and those of its ancestors at
+    the levels above, and the last column gives the value of the key. The
+    levels depend on the tree's hierarchy: see `levels()`.
+
+    """
+    LEVELS = [(SkFunctionNode, 'Function'),
+              (SkLibraryNode,  'Module'),
+              (SkCommandNode,  'Command')]
+
+    CALLGRAPH_LEVELS = [(SkCallNode,    'Call path'),
+                        (SkCommandNode, 'Command')]
+
+    def __init__(self, parent=None):
+        super(SkHotSpotModel, self).__init__(parent)
+        self._tree  = None
+        self._key   = None
+        self._level = 0
+        self._rows  = []
+
+
+    def setTree(self, tree):
+        self.beginResetModel()
+        self._tree = tree
+        self._rows = []
+        self.endResetModel()
+
+
+    def levels(self):
+        """Returns the (class, name) levels of the current tree, leaves first"""
+        if self._tree is not None and self._tree.getHierarchy() == SkTree.HIERARCHY_CALLGRAPH:
+            return SkHotSpotModel.CALLGRAPH_LEVELS
+        return SkHotSpotModel.LEVELS
+
+
+    def query(self, key, k, level=0):
+        self.beginResetModel()
+        self._key   = key
+        self._level = level
+        if self._tree is None or not key:
+            self._rows = []
+        else:
+            klass = self.levels()[level][0]
+            self._rows = self._tree.topNodes(key, k, klass)
+        self.endResetModel()
+
+
+    def getNode(self, row):
+        return self._rows[row][0]
+
+
+    def _labelColumnCount(self):
+        return len(self.levels()) - self._level
+
+
+    def rowCount(self, parent=None):
+        if parent is not None and parent.isValid():
+            return 0
+        return len(self._rows)
+
+
+    def columnCount(self, parent=None):
+        return self._labelColumnCount() + 1
+
+
+    def data(self, index, role):
+        if not index.isValid():
+            return None
+
+        col = index.column()
+        skNode, value = self._rows[index.row()]
+
+        if role == QtCore.Qt.DisplayRole:
+            if col == self._labelColumnCount():
+                return value
+            if col == 0:
+                return skNode.label
+            # The nearest ancestor of this column's level (call paths nest):
+            klass = self.levels()[self._level + col][0]
+            for ancestor in skNode.iterAncestors():
+                if type(ancestor) is klass:
+                    return ancestor.label
+
+        if role == QtCore.Qt.TextAlignmentRole and col == self._labelColumnCount():
+            return QtCore.Qt.AlignRight
+
+
+    def headerData(self, section, orientation, role):
+        if role != QtCore.Qt.DisplayRole or orientation != QtCore.Qt.Horizontal:
+            return None
+        if section < self._labelColumnCount():
+            return self.levels()[self._level + section][1]
+        return self._key
+
+
+
+class SkFlatTableModel(QtCore.QAbstractTableModel):
+    """
+    A flat table of every function (or, in a call graph, every call path)
+    across all commands and modules, with the same data columns as the
+    `SkTreeModel` it is built on, and filtered by the same `SkFilter`s as the
+    given `SkSortFilterProxyModel`.
+
+    Rows are just positions in a list of node indexes: sorting builds (and
+    caches) a permutation of the nodes for the column, filtering removes the
+    hidden ones from it, and rows are handed to the view in batches as it
+    scrolls, via `canFetchMore()`/`fetchMore()`, so that a table of a million
+    functions opens as quickly as one of a thousand.
+
+    """
+    LABEL_COLUMN = 0
+    PATH_COLUMN  = 1
+    NONDATA_COLUMN_COUNT = 2
+    FETCH_BATCH_SIZE = 2000
+
+    def __init__(self, treeModel, proxyModel, parent=None):
+        super(SkFlatTableModel, self).__init__(parent)
+        self._treeModel  = treeModel
+        self._proxyModel = proxyModel
+        self._tree = treeModel.getTree()
+        if self._tree.getHierarchy() == SkTree.HIERARCHY_CALLGRAPH:
+            self._nodes = self._tree.levelNodes(SkCallNode)
+        else:
+            self._nodes = self._tree.levelNodes(SkFunctionNode)
+        self._orders  = {}
+        self._sortColumn = None
+        self._sortOrder  = QtCore.Qt.AscendingOrder
+        self._rows    = []
+        self._fetched = 0
+
+        treeModel.columnsInserted.connect(self._treeColumnsInserted)
+        treeModel.columnsAboutToBeRemoved.connect(self._treeColumnsAboutToBeRemoved)
+        treeModel.columnsRemoved.connect(self._treeColumnsRemoved)
+        proxyModel.filtersChanged.connect(self.refilter)
+        self._refresh()
+
+
+    def detach(self):
+        """Disconnects the table from its tree and proxy models, for disposal"""
+        self._treeModel.columnsInserted.disconnect(self._treeColumnsInserted)
+        self._treeModel.columnsAboutToBeRemoved.disconnect(self._treeColumnsAboutToBeRemoved)
+        self._treeModel.columnsRemoved.disconnect(self._treeColumnsRemoved)
+        self._proxyModel.filtersChanged.disconnect(self.refilter)
+
+
+    def _column(self, treeCol):
+        return treeCol - SkTreeModel.NONDATA_COLUMN_COUNT + SkFlatTableModel.NONDATA_COLUMN_COUNT
+
+
+    def _treeColumnsInserted(self, parent, first, last):
+        self.beginInsertColumns(QtCore.QModelIndex(), self._column(first), self._column(last))
+        self.endInsertColumns()
+
+
+    def _treeColumnsAboutToBeRemoved(self, parent, first, last):
+        self.beginRemoveColumns(QtCore.QModelIndex(), self._column(first), self._column(last))
+
+
+    def _treeColumnsRemoved(self, parent, first, last):
+        # The cached orders are indexed by column, which have moved:
+        self._orders = {}
+        self.endRemoveColumns()
+
+
+    def _order(self, col):
+        """Returns the node indexes sorted (ascending) on the given column"""
+        if col not in self._orders:
+            nodes = self._nodes
+            if col == SkFlatTableModel.LABEL_COLUMN:
+                values = [n.label for n in nodes]
+            elif col == SkFlatTableModel.PATH_COLUMN:
+                values = [n.parent().getPath() for n in nodes]
+            else:
+                key = self._tree.getKey(col - SkFlatTableModel.NONDATA_COLUMN_COUNT)
+                values = [(v is not None, v) for v in [n.getData(key) for n in nodes]]
+            self._orders[col] = sorted(range(len(nodes)), key=values.__getitem__)
+        return self._orders[col]
+
+
+    def _refresh(self):
+        if self._sortColumn is None:
+            order = range(len(self._nodes))
+        else:
+            order = self._order(self._sortColumn)
+            if self._sortOrder == QtCore.Qt.DescendingOrder:
+                order = order[::-1]
+        isVisible = self._proxyModel.isVisible
+        nodes = self._nodes
+        self._rows = [i for i in order if isVisible(nodes[i])]
+        self._fetched = min(len(self._rows), SkFlatTableModel.FETCH_BATCH_SIZE)
+
+
+    def refilter(self):
+        if self._proxyModel.sourceModel() is not self._treeModel:
+            # The proxy has moved on to another tree
+            return
+        self.beginResetModel()
+        self._refresh()
+        self.endResetModel()
+
+
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        self.beginResetModel()
+        self._sortColumn = column
+        self._sortOrder  = order
+        self._refresh()
+        self.endResetModel()
+
+
+    def getNode(self, row):
+        return self._nodes[self._rows[row]]
+
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self._fetched < len(self._rows)
+
+
+    def fetchMore(self, parent):
+        if parent.isValid():
+            return
+        count = min(len(self._rows) - self._fetched, SkFlatTableModel.FETCH_BATCH_SIZE)
+        self.beginInsertRows(QtCore.QModelIndex(), self._fetched, self._fetched + count - 1)
+        self._fetched += count
+        self.endInsertRows()
+
+
+    def rowCount(self, parent=None):
+        if parent is not None and parent.isValid():
+            return 0
+        return self._fetched
+
+
+    def columnCount(self, parent=None):
+        return self._tree.keyCount() + SkFlatTableModel.NONDATA_COLUMN_COUNT
+
+
+    def data(self, index, role):
+        if not index.isValid():
+            return None
+
+        col = index.column()
+
+        if role == QtCore.Qt.DisplayRole:
+            skNode = self._nodes[self._rows[index.row()]]
+            if col == SkFlatTableModel.LABEL_COLUMN:
+                return skNode.label
+            if col == SkFlatTableModel.PATH_COLUMN:
+                return skNode.parent().getPath()
+            return skNode.getData(self._tree.getKey(col - SkFlatTableModel.NONDATA_COLUMN_COUNT))
+
+        if role == SkTreeModel.DISPLAY_TEXT_ROLE and col >= SkFlatTableModel.NONDATA_COLUMN_COUNT:
+            # Share the tree's cache of formatted values:
+            skNode = self._nodes[self._rows[index.row()]]
+            treeCol = col - SkFlatTableModel.NONDATA_COLUMN_COUNT + SkTreeModel.NONDATA_COLUMN_COUNT
+            return self._treeModel.displayText(treeCol, skNode)
+
+        if role == QtCore.Qt.TextAlignmentRole and col >= SkFlatTableModel.NONDATA_COLUMN_COUNT:
+            return QtCore.Qt.AlignRight
+
+
+    def headerData(self, section, orientation, role):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        if orientation == QtCore.Qt.Vertical:
+            return section + 1
+        if section == SkFlatTableModel.LABEL_COLUMN:
+            return "Function"
+        if section == SkFlatTableModel.PATH_COLUMN:
+            return "Location"
+        return self._tree.getKey(section - SkFlatTableModel.NONDATA_COLUMN_COUNT)
+
+
+
 class SkFilter(QtCore.QObject):
     toggled = QtCore.pyqtSignal()
 
@@ -168,10 +568,173 @@ class SkFilter(QtCore.QObject):
 
 
 
+class SkFilterMatcher(object):
+    """
+    Matches a node against a whole set of filters (for one node class) at
+    once, returning a bitmap of the filters that match.
+
+    The patterns of all the filters on the same attribute are combined into a
+    single regex made of optional lookaheads, one per filter:
+
+        (?=.*?(?P<f0>\.ko$))?(?=.*?(?P<f1>^\[vdso\]$))?...
+
+    Each lookahead records in its named group whether its pattern occurs
+    anywhere in the string, so one `match()` call evaluates every filter, and
+    the order of the filters doesn't matter. A filter whose pattern can't be
+    combined (see `combinable()`) is matched on its own.
+
+    """
+    # The flags of a pattern with no inline flags:
+    PLAIN_FLAGS = re.compile('').flags
+
+    def __init__(self, filters):
+        """`filters` is a sequence of (bit, SkFilter) pairs"""
+        super(SkFilterMatcher, self).__init__()
+        byAttr = {}
+        for bit, f in filters:
+            byAttr.setdefault(f.attr, []).append((bit, f))
+
+        self._combined = []
+        self._single = []
+        for attr, pairs in byAttr.iteritems():
+            groups = {}
+            parts = []
+            for i, (bit, f) in enumerate(pairs):
+                if not SkFilterMatcher.combinable(f.regex):
+                    self._single.append((attr, f.regex, bit))
+                    continue
+                groups['f%d' % i] = bit
+                parts.append('(?=.*?(?P<f%d>%s))?' % (i, f.regex.pattern))
+            if parts:
+                try:
+                    self._combined.append((attr, re.compile(''.join(parts)), groups))
+                except re.error:
+                    # Fall back to matching this attribute's filters one by one
+                    for bit, f in pairs:
+                        if bit in groups.values():
+                            self._single.append((attr, f.regex, bit))
+
+
+    @staticmethod
+    def combinable(regex):
+        """
+        True if the pattern of the compiled `regex` means the same inside the
+        combined regex: it has no groups of its own (whose names could clash,
+        and whose numbers, and so backreferences, would shift), and no inline
+        flags (which would apply to every other filter).
+
+        """
+        return regex.groups == 0 and regex.flags == SkFilterMatcher.PLAIN_FLAGS
+
+
+    def match(self, skNode):
+        """Returns the bitmap of the filters that match the node"""
+        mask = 0
+        attrs = skNode.__dict__
+        for attr, regex, groups in self._combined:
+            m = regex.match(attrs[attr])
+            for name, bit in groups.iteritems():
+                if m.group(name) is not None:
+                    mask |= bit
+        for attr, regex, bit in self._single:
+            if regex.search(attrs[attr]):
+                mask |= bit
+        return mask
+
+
+
 class SkSortFilterProxyModel(QtGui.QSortFilterProxyModel):
+    """
+    Hides rows that match any inactive (i.e. hidden) `SkFilter`.
+
+    Every node is matched against every filter once (see `SkFilterMatcher`),
+    when the source model is set or a filter is added, and the result is kept
+    as a bitmap per node id in which bit i is set if the node matches the i-th
+    filter added. Deciding whether to show a row is then a single AND with the
+    bitmap of hidden filters, which is all that changes when a filter is
+    toggled.
+
+    Sorting doesn't go through `data()`: for each column, the nodes in every
+    group of siblings are sorted once, by a plain Python key, and each node's
+    rank within its group is stored by node id. `lessThan()` then just compares
+    two ranks. The ranks are kept until the data they depend on changes.
+
+    """
+    filtersChanged = QtCore.pyqtSignal()
+
     def __init__(self, parent=None):
         super(SkSortFilterProxyModel, self).__init__(parent)
         self._filterSet = {}
+        self._filters = []
+        self._masks = []
+        self._pathMasks = []
+        self._hiddenMask = 0
+        self._sortRanks = {}
+        self._typeNames = []
+
+
+    def setSourceModel(self, model):
+        # Classify first, since setting the model makes the view ask for rows,
+        # but only tell listeners once the new model is in place:
+        self._classify(model.getTree())
+        self._sortRanks = {}
+        super(SkSortFilterProxyModel, self).setSourceModel(model)
+        model.dataChanged.connect(self._sourceDataChanged)
+        model.modelReset.connect(self.invalidateSortKeys)
+        model.columnsInserted.connect(self.invalidateSortKeys)
+        model.columnsRemoved.connect(self.invalidateSortKeys)
+        self.filtersChanged.emit()
+
+
+    def invalidateSortKeys(self, *args):
+        self._sortRanks = {}
+
+
+    def _sourceDataChanged(self, topLeft, bottomRight):
+        # Only check marks change after loading:
+        self._sortRanks.pop(SkTreeModel.PLOT_COLUMN, None)
+
+
+    def _sortKey(self, col):
+        """Returns a function giving the value that a node sorts by in `col`"""
+        if col == SkTreeModel.TREE_COLUMN:
+            return lambda skNode: skNode.label
+        if col == SkTreeModel.TYPE_COLUMN:
+            return self.typeName
+        if col == SkTreeModel.PLOT_COLUMN:
+            return lambda skNode: skNode.isChecked()
+        key = self.sourceModel().getTree().getKey(col - SkTreeModel.NONDATA_COLUMN_COUNT)
+        def valueKey(skNode):
+            # Nodes with no value sort before every number (and so after them
+            # in descending order, which just reverses the ranks):
+            value = skNode.getData(key)
+            return (value is not None, value)
+        return valueKey
+
+
+    def sortRanks(self, col):
+        """
+        Returns a list, indexed by node id, of each node's position among its
+        siblings when sorted (ascending) on the given column.
+
+        """
+        if col not in self._sortRanks:
+            tree = self.sourceModel().getTree()
+            keyFn = self._sortKey(col)
+            ranks = [0] * tree.nodeCount()
+            for skNode in tree.iterPreOrder():
+                if skNode.childCount() < 2:
+                    continue
+                children = [skNode.getChild(i) for i in range(skNode.childCount())]
+                for rank, child in enumerate(sorted(children, key=keyFn)):
+                    ranks[child.id] = rank
+            self._sortRanks[col] = ranks
+        return self._sortRanks[col]
+
+
+    def lessThan(self, left, right):
+        ranks = self.sortRanks(left.column())
+        return ranks[left.internalPointer().id] < ranks[right.internalPointer().id]
 
 
     def addFilter(self, filter_):
@@ -179,21 +742,75 @@ class SkSortFilterProxyModel(QtGui.QSortFilterProxyModel):
         if filter_.klass not in self._filterSet:
             self._filterSet[filter_.klass] = []
         self._filterSet[filter_.klass].append(filter_)
-        filter_.toggled.connect(self.invalidateFilter)
+        self._filters.append(filter_)
+        filter_.toggled.connect(self._filterToggled)
+        self._updateHiddenMask()
+        if self.sourceModel() is not None:
+            self._classify(self.sourceModel().getTree())
+            self.invalidateFilter()
+            self.filtersChanged.emit()
+
+
+    def _filterToggled(self):
+        self._updateHiddenMask()
+        self.invalidateFilter()
+        self.filtersChanged.emit()
+
+
+    def _updateHiddenMask(self):
+        mask = 0
+        for i, f in enumerate(self._filters):
+            if not f.isActive:
+                mask |= 1 << i
+        self._hiddenMask = mask
+
+
+    def _classify(self, tree):
+        """Computes the filter bitmap of every node in the tree"""
+        bits = dict((f, 1 << i) for i, f in enumerate(self._filters))
+        matchers = {}
+        for klass, filters in self._filterSet.iteritems():
+            matchers[klass] = SkFilterMatcher([(bits[f], f) for f in filters])
+
+        masks = [0] * tree.nodeCount()
+        pathMasks = [0] * tree.nodeCount()
+        for skNode in tree.iterPreOrder():
+            matcher = matchers.get(type(skNode))
+            if matcher is not None:
+                masks[skNode.id] = matcher.match(skNode)
+            # Parents come first in pre-order:
+            pathMasks[skNode.id] = masks[skNode.id]
+            if skNode.parent() is not None:
+                pathMasks[skNode.id] |= pathMasks[skNode.parent().id]
+        self._masks = masks
+        self._pathMasks = pathMasks
+        # The type names depend on the filters matched:
+        self._typeNames = [None] * tree.nodeCount()
+
+
+    def filterMask(self, skNode):
+        """Returns the bitmap of filters that the node matches"""
+        return self._masks[skNode.id]
+
+
+    def isVisible(self, skNode):
+        """True if neither the node nor any of its ancestors is filtered out"""
+        return not self._pathMasks[skNode.id] & self._hiddenMask
 
 
     def findFilter(self, skNode, activeOnly=True):
-        if type(skNode) not in self._filterSet:
+        """
+        Returns the first filter (in the order added) that the node matches or,
+        if `activeOnly`, the first hidden filter that it matches; else None.
+
+        """
+        mask = self._masks[skNode.id]
+        if activeOnly:
+            mask &= self._hiddenMask
+        if not mask:
             return None
-
-        match = None
-        for f in self._filterSet[type(skNode)]:
-            if activeOnly and f.isActive:
-                continue
-            if f.regex.search(skNode.__dict__[f.attr]):
-                match = f
-                break   
-        return match     
+        # The lowest set bit is the first matching filter:
+        return self._filters[(mask & -mask).bit_length() - 1]
 
 
     def filterAcceptsRow(self, row, parent):
@@ -202,39 +819,48 @@ class SkSortFilterProxyModel(QtGui.QSortFilterProxyModel):
             return True
         skNode = skNode.getChild(row)
 
-        match = self.findFilter(skNode, activeOnly=True)
-
-        if match is None:
-            return True
-        
-        return False
+        return not self._masks[skNode.id] & self._hiddenMask
     
     
     def data(self, index, role):
+        # We only use the proxy model data for the "type" column:
+        if index.column() != SkTreeModel.TYPE_COLUMN:
+            return super(SkSortFilterProxyModel, self).data(index, role)
+
+        if role != QtCore.Qt.DisplayRole:
+            return None
+
         smi = self.mapToSource(index)
         if not smi.isValid():
             return None
 
-        # We only use the proxy model data for the "type" column:
-        if smi.column() != SkTreeModel.TYPE_COLUMN:
-            return self.sourceModel().data(smi, role)
-        
-        if role != QtCore.Qt.DisplayRole:
-            return None
-        
-        match = self.findFilter(smi.internalPointer(), activeOnly=False)
+        skNode = smi.internalPointer()
+        name = self._typeNames[skNode.id]
+        if name is None:
+            name = self.typeName(skNode)
+            self._typeNames[skNode.id] = name
+        return name
+
+
+    def typeName(self, skNode):
+        """Returns the text shown in the "type" column for the node"""
+        match = self.findFilter(skNode, activeOnly=False)
         if match is not None:
             return match.name.capitalize()
         
-        t = type(smi.internalPointer())
+        t = type(skNode)
         if t == SkFunctionNode:
             return 'Vanilla function'
         if t == SkLibraryNode:
-            if smi.internalPointer().isJunior():
+            if skNode.isJunior():
                 return 'Vanilla binary'
             return 'Vanilla module'
         if t == SkCommandNode:
             return 'Vanilla command'
+        if t == SkCallNode:
+            if skNode.childCount():
+                return 'Caller'
+            return 'Leaf function'
         
 
         
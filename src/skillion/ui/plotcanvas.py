@@ -0,0 +1,664 @@
+"""
+    The matplotlib canvas that draws the roofline plot. This is the only
+    module of the GUI that imports matplotlib, and `SkPlotWidget` only
+    imports it once there is a profile to plot.
+
+"""
+
+import math
+
+from PyQt4 import QtCore
+from PyQt4 import QtGui
+
+import numpy
+from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
+
+from skillion import plot
+
+class SkPointGrid(object):
+    """
+    A spatial index of points in display (pixel) coordinates: a hash of square
+    cells, each listing the points that fall in it. With cells no smaller than
+    the search radius, finding the nearest point to the mouse means looking
+    at the points in just 3x3 cells, however many are plotted.
+
+    """
+    def __init__(self, xy, cellSize):
+        super(SkPointGrid, self).__init__()
+        self._xy = xy
+        self._cellSize = float(cellSize)
+        self._cells = {}
+        cells = numpy.floor(xy / self._cellSize).astype(int)
+        for row, cell in enumerate(cells.tolist()):
+            self._cells.setdefault(tuple(cell), []).append(row)
+
+
+    def nearest(self, x, y, radius):
+        """Returns the row of the nearest point within `radius` of (x, y), or None"""
+        cx = int(math.floor(x / self._cellSize))
+        cy = int(math.floor(y / self._cellSize))
+        best = None
+        bestDist = radius * radius
+        for i in (cx-1, cx, cx+1):
+            for j in (cy-1, cy, cy+1):
+                for row in self._cells.get((i, j), ()):
+                    dx = self._xy[row, 0] - x
+                    dy = self._xy[row, 1] - y
+                    d = dx*dx + dy*dy
+                    if d <= bestDist:
+                        best = row
+                        bestDist = d
+        return best
+
+
+
+class SkRedrawScheduler(QtCore.QObject):
+    """
+    Coalesces redraw requests: however many times `request()` is called
+    before control gets back to the event loop, `render` is called just once,
+    on its next pass. The `requested` and `rendered` counters show how many
+    renders that saved.
+
+    """
+    def __init__(self, render, parent=None):
+        super(SkRedrawScheduler, self).__init__(parent)
+        self._render = render
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(0)
+        self._timer.timeout.connect(self._fire)
+        self.requested = 0
+        self.rendered  = 0
+
+
+    def request(self):
+        self.requested += 1
+        if not self._timer.isActive():
+            self._timer.start()
+
+
+    def flush(self):
+        """Renders now if a render is pending"""
+        if self._timer.isActive():
+            self._timer.stop()
+            self._fire()
+
+
+    def _fire(self):
+        self.rendered += 1
+        self._render()
+
+
+    def saved(self):
+        return self.requested - self.rendered
+
+
+    def __str__(self):
+        return '%d redraws requested, %d rendered (%d saved)' % (self.requested, self.rendered, self.saved())
+
+
+
+class SkPlotCanvas(FigureCanvas):
+    """
+    The roofline plot. All plotted points are held in a single scatter
+    collection, backed by NumPy arrays of offsets and colours that are
+    updated in place.
+
+    Setters only record what has changed and ask the `SkRedrawScheduler` in
+    `redrawScheduler` for a redraw, so changing the events, scales, limits
+    and points in one go (or checking many nodes at once) costs one render
+    rather than one each.
+
+    The points and the highlight of the last one clicked are "animated"
+    artists, which a full draw leaves out: after each full draw, the static
+    background (grid, ticks, labels, CPI lines) is saved, and changes to the
+    points are shown by restoring it and blitting just those artists on top.
+    A full draw is only done when the scales, limits or labels have actually
+    changed since the last one.
+
+    Clicks and hovering are resolved against an `SkPointGrid` of the points'
+    positions on screen, which is rebuilt (lazily) whenever the points, the
+    view or the widget's size change.
+
+    The CPI reference lines (y = m*x) are a single `LineCollection`, whose
+    geometry is cached per combination of axis bases, x limits and slopes.
+
+    In "plot everything" mode (see `setDensityData()`), every node is shown
+    behind the checked points: as individual dots when few enough of them are
+    in view, and otherwise as a hexagonal-bin density map over the current
+    limits, so zooming in on a dense region turns it back into dots.
+
+    """
+    # Area of a point's marker, in points squared (see skillion/plot.py):
+    MARKER_SIZE = plot.MARKER_SIZE
+    # How close (in pixels) the mouse has to be to a point to pick it:
+    PICK_RADIUS = 5
+    # Above this many nodes in view, "plot everything" shows a density map:
+    DENSITY_THRESHOLD = 5000
+    DENSITY_GRIDSIZE  = 80
+    # ...which is binned from an evenly strided sample of at most this many:
+    DENSITY_SAMPLE_SIZE = 250000
+    # Most CPI line geometries kept, per (bases, x limits, slopes):
+    CPI_CACHE_SIZE = 64
+
+    def __init__(self,  parent=None):
+        self._fig    = Figure( plot.FIGSIZE, dpi=plot.DPI )
+        super(SkPlotCanvas, self).__init__(self._fig)
+        self.setParent(parent)
+        self._xbase  = None
+        self._ybase  = None
+        self._xevent = None
+        self._yevent = None
+        self._xlim   = None
+        self._ylim   = None
+        self._points = []
+        self._pointIndex = {}
+        self._offsets = numpy.empty((0, 2))
+        self._colors  = numpy.empty((0, 4))
+        self._callbacks = []
+        self._labels = []
+        self._pickGrid = None
+        self._pickGridState = None
+        self._pointsVersion = 0
+        self._hovered = None
+        self._colorCount = 0
+        self._scatter = None
+        self._highlight = None
+        self._highlighted = None
+        self._background = None
+        self._renderedState = None
+        self._axesStale = False
+        self._backgroundStale = False
+        self.redrawScheduler = SkRedrawScheduler(self._render, self)
+        self._density = None
+        self._densityArtist = None
+        self._densityStale = False
+        self._updatingDensity = False
+        self._cpiLines = None
+        self._cpiShown = False
+        self._cpiSlopes = []
+        self._cpiCache = {}
+
+        plot.applyRc()
+        self.setupMpl(100, 8, 5)
+        self.mpl_connect('button_press_event', self.onClick)
+        self.mpl_connect('motion_notify_event', self.onHover)
+        self.mpl_connect('draw_event', self._onDraw)
+        self._axes.callbacks.connect('xlim_changed', self._limitsChanged)
+        self._axes.callbacks.connect('ylim_changed', self._limitsChanged)
+
+
+    def addPoint(self, pid, x, y, callback, label=None):
+        """
+        Plots a point with id `pid` at (x, y); `callback` is called when it is
+        clicked, and `label` is shown when the mouse is over it. Returns the
+        (r, g, b) colour given to the point.
+
+        """
+        return self.addPoints([(pid, x, y, callback, label)])[0]
+
+
+    def addPoints(self, points):
+        """
+        Plots a sequence of (pid, x, y, callback, label) points, replacing any with
+        the same id, and returns their (r, g, b) colours in the same order
+        (a point given more than once is plotted once, at its last position).
+
+        """
+        # Later duplicates win:
+        latest = {}
+        for n, point in enumerate(points):
+            latest[point[0]] = n
+        points = [point for n, point in enumerate(points) if latest[point[0]] == n]
+
+        for point in points:
+            if point[0] in self._pointIndex:
+                self._removeRow(point[0])
+
+        colors = []
+        for pid, x, y, callback, label in points:
+            rgb = plot.paletteColor(self._colorCount)
+            self._colorCount += 1
+            self._pointIndex[pid] = len(self._points)
+            self._points.append(pid)
+            self._callbacks.append(callback)
+            self._labels.append(label)
+            colors.append(rgb)
+
+        if points:
+            self._offsets = numpy.vstack((self._offsets, [(p[1], p[2]) for p in points]))
+            self._colors  = numpy.vstack((self._colors, [rgb + (1.0,) for rgb in colors]))
+            self._updateScatter()
+        return colors
+
+
+    def removePoint(self, pid):
+        self.removePoints([pid])
+
+
+    def removePoints(self, pids):
+        for pid in pids:
+            if pid not in self._pointIndex:
+                continue
+            self._removeRow(pid)
+            if pid == self._highlighted:
+                self._highlighted = None
+        self._updateScatter()
+
+
+    def _removeRow(self, pid):
+        """Removes a point from the arrays by moving the last one into its place"""
+        row = self._pointIndex.pop(pid)
+        last = len(self._points) - 1
+        if row != last:
+            lastPid = self._points[last]
+            self._points[row] = lastPid
+            self._callbacks[row] = self._callbacks[last]
+            self._labels[row] = self._labels[last]
+            self._offsets[row] = self._offsets[last]
+            self._colors[row] = self._colors[last]
+            self._pointIndex[lastPid] = row
+        self._points.pop()
+        self._callbacks.pop()
+        self._labels.pop()
+        self._offsets = self._offsets[:last]
+        self._colors  = self._colors[:last]
+
+
+    def _updateScatter(self):
+        """Pushes the point arrays into the scatter collection and schedules a redraw"""
+        if self._scatter is None:
+            self._scatter = self._axes.scatter([], [], s=SkPlotCanvas.MARKER_SIZE,
+                                               marker='o', linewidths=0.5, zorder=2,
+                                               animated=True)
+            self._highlight, = self._axes.plot([], [], 'o', markersize=12, markerfacecolor='none',
+                                               markeredgecolor='k', markeredgewidth=1.5,
+                                               zorder=3, animated=True)
+        self._pointsVersion += 1
+        self._scatter.set_offsets(self._offsets)
+        self._scatter.set_facecolors(self._colors)
+        self._scatter.set_edgecolors(self._colors)
+        self._updateHighlight()
+
+        self._autoscale()
+        self.refresh()
+
+
+    def _autoscale(self):
+        # Collections don't take part in relim(), so autoscaling has to be fed
+        # the extent of the points (and of the density layer) by hand:
+        a = self._axes
+        a.ignore_existing_data_limits = True
+        if len(self._offsets):
+            a.update_datalim(self._offsets)
+        if self._density is not None and len(self._density[0]):
+            a.update_datalim(numpy.column_stack(self._density))
+        a.autoscale_view()
+
+
+    def highlightPoint(self, pid):
+        """Rings the point with id `pid`, or nothing if it is None or not plotted"""
+        self._highlighted = pid
+        self._updateHighlight()
+        self.refresh()
+
+
+    def _updateHighlight(self):
+        if self._highlight is None:
+            return
+        row = self._pointIndex.get(self._highlighted)
+        if row is None:
+            self._highlight.set_data([], [])
+        else:
+            self._highlight.set_data([self._offsets[row, 0]], [self._offsets[row, 1]])
+
+
+    def _animatedArtists(self):
+        return [a for a in (self._scatter, self._highlight) if a is not None]
+
+
+    def _viewState(self):
+        """Everything that, if changed, makes the saved background stale"""
+        a = self._axes
+        return (a.get_xscale(), a.get_yscale(), tuple(a.get_xlim()), tuple(a.get_ylim()),
+                a.get_xlabel(), a.get_ylabel())
+
+
+    def _onDraw(self, event):
+        # A full draw has just been rendered without the animated artists:
+        # keep it as the background, then draw them on top.
+        self._background = self.copy_from_bbox(self._axes.bbox)
+        self._renderedState = self._viewState()
+        for artist in self._animatedArtists():
+            self._axes.draw_artist(artist)
+
+
+    def refresh(self):
+        """Schedules a redraw, on the next pass through the event loop"""
+        self.redrawScheduler.request()
+
+
+    def _render(self):
+        """
+        Shows the current state of the plot: by blitting the animated artists
+        onto the saved background if that is still valid, or else by a full
+        draw.
+
+        """
+        if self._axesStale:
+            self._applyAxes()
+        if (self._background is None or self._backgroundStale
+            or self._viewState() != self._renderedState):
+            # The density layer is binned over the view, so it goes stale too:
+            self._densityStale = self._densityStale or self._density is not None
+            self._backgroundStale = False
+            self.draw()
+            return
+        self.restore_region(self._background)
+        for artist in self._animatedArtists():
+            self._axes.draw_artist(artist)
+        self.blit(self._axes.bbox)
+
+
+    def setDensityData(self, x, y):
+        """
+        Shows every (x[i], y[i]) behind the plotted points, or stops doing so
+        if `x` is None. Both are NumPy arrays of the same length.
+
+        """
+        if x is None:
+            self._density = None
+        else:
+            self._density = (numpy.asarray(x, dtype=float), numpy.asarray(y, dtype=float))
+        self._autoscale()
+        self._densityStale = True
+        self._backgroundStale = True
+        self.refresh()
+
+
+    def _limitsChanged(self, axes):
+        if not self._updatingDensity and self._density is not None:
+            self._densityStale = True
+
+
+    def _updateDensity(self):
+        """Rebuilds the density layer for the current scales and limits"""
+        self._densityStale = False
+        if self._densityArtist is not None:
+            self._densityArtist.remove()
+            self._densityArtist = None
+        if self._density is None:
+            return
+
+        a = self._axes
+        x, y = self._density
+        (x0, x1), (y0, y1) = sorted(a.get_xlim()), sorted(a.get_ylim())
+        xlog = a.get_xscale() == 'log'
+        ylog = a.get_yscale() == 'log'
+        inView = (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+        x = x[inView]
+        y = y[inView]
+        if not len(x):
+            return
+
+        if len(x) <= SkPlotCanvas.DENSITY_THRESHOLD:
+            self._densityArtist = a.scatter(x, y, s=4, marker='o', linewidths=0,
+                                            color='0.55', zorder=1.5)
+        else:
+            stride = int(math.ceil(len(x) / float(SkPlotCanvas.DENSITY_SAMPLE_SIZE)))
+            if stride > 1:
+                x = x[::stride]
+                y = y[::stride]
+            # hexbin() takes the extent in the (log10-)transformed coordinates:
+            extent = (math.log10(x0) if xlog else x0, math.log10(x1) if xlog else x1,
+                      math.log10(y0) if ylog else y0, math.log10(y1) if ylog else y1)
+            self._densityArtist = a.hexbin(x, y, gridsize=SkPlotCanvas.DENSITY_GRIDSIZE,
+                                           xscale='log' if xlog else 'linear',
+                                           yscale='log' if ylog else 'linear',
+                                           extent=extent, bins='log', mincnt=1,
+                                           cmap='Greys', linewidths=0, zorder=1.5)
+
+
+    def draw(self):
+        if self._densityStale:
+            self._updatingDensity = True
+            xlim = self._axes.get_xlim()
+            ylim = self._axes.get_ylim()
+            self._updateDensity()
+            # Adding the layer must not move the view, and hexbin() resets
+            # log scales to base 10:
+            self._applyScales()
+            self._axes.set_xlim(xlim)
+            self._axes.set_ylim(ylim)
+            self._updatingDensity = False
+        if self._cpiShown:
+            self._updateCpiLines()
+        super(SkPlotCanvas, self).draw()
+
+
+    def clearCpiLines(self):
+        self._cpiShown = False
+        self._cpiLines.set_segments([])
+        self._backgroundStale = True
+        self.refresh()
+
+
+    def addCpiSlope(self, slope, color='r'):
+        """
+        Adds a reference line y = slope*x, e.g. a ceiling derived from a
+        machine's peak rates, to those drawn by `drawCpiLines()`.
+
+        """
+        self._cpiSlopes.append((float(slope), color))
+        if self._cpiShown:
+            self.drawCpiLines()
+
+
+    def clearCpiSlopes(self):
+        self._cpiSlopes = []
+        if self._cpiShown:
+            self.drawCpiLines()
+
+
+    def _cpiGeometry(self):
+        """Returns the (segments, colours) of the CPI lines across the current x limits"""
+        x_lim = tuple(self._axes.get_xlim())
+        slopes = plot.CPI_SLOPES + self._cpiSlopes
+        key = (self._xbase, self._ybase, x_lim, tuple(slopes))
+        geometry = self._cpiCache.get(key)
+        if geometry is not None:
+            return geometry
+
+        geometry = plot.cpiGeometry(self._xbase, self._ybase, x_lim, slopes)
+        if len(self._cpiCache) >= SkPlotCanvas.CPI_CACHE_SIZE:
+            self._cpiCache.clear()
+        self._cpiCache[key] = geometry
+        return geometry
+
+
+    def _updateCpiLines(self):
+        segments, colors = self._cpiGeometry()
+        self._cpiLines.set_segments(segments)
+        self._cpiLines.set_color(colors)
+
+
+    def drawCpiLines(self):
+        self._cpiShown = True
+        self._updateCpiLines()
+        # The lines are part of the background:
+        self._backgroundStale = True
+        self.refresh()
+
+
+    def _pointAt(self, event):
+        """Returns the row of the plotted point under the mouse, or None"""
+        if event.inaxes is not self._axes or not len(self._offsets):
+            return None
+        state = (self._viewState(), self._pointsVersion, self.width(), self.height())
+        if self._pickGrid is None or state != self._pickGridState:
+            xy = self._axes.transData.transform(self._offsets)
+            self._pickGrid = SkPointGrid(xy, 2*SkPlotCanvas.PICK_RADIUS)
+            self._pickGridState = state
+        return self._pickGrid.nearest(event.x, event.y, SkPlotCanvas.PICK_RADIUS)
+
+
+    def onClick(self, event):
+        row = self._pointAt(event)
+        if row is not None:
+            self.highlightPoint(self._points[row])
+            self._callbacks[row]()
+
+
+    def onHover(self, event):
+        row = self._pointAt(event)
+        pid = None if row is None else self._points[row]
+        if pid == self._hovered:
+            return
+        self._hovered = pid
+        if row is None or self._labels[row] is None:
+            QtGui.QToolTip.hideText()
+            return
+        x, y = self._offsets[row]
+        text = '%s\n%s: %g\n%s: %g' % (self._labels[row], self._xevent, x, self._yevent, y)
+        QtGui.QToolTip.showText(QtGui.QCursor.pos(), text, self)
+
+    def setXBase(self, value, draw=True):
+        self._xbase = int(str(value))
+        if draw:
+            self.drawAxes()
+
+    def setYBase(self, value, draw=True):
+        self._ybase = int(str(value))
+        if draw:
+            self.drawAxes()
+
+    @classmethod
+    def _parsePow(cls, s):
+        n = s.split('^')
+        if len(n)==1:
+            return 10, int(n[0])
+        return int(n[0]), int(n[1])
+
+    def setXAxisLo(self, value, draw=True):
+        base,exponent = SkPlotCanvas._parsePow(str(value))
+        self._xlim = list(self._axes.get_xlim())
+        self._xlim[0] = base**exponent
+        self._axes.set_xlim(self._xlim)
+        if draw:
+            self.drawAxes()
+
+    def setXAxisHi(self, value, draw=True):
+        base,exponent = SkPlotCanvas._parsePow(str(value))
+        self._xlim = list(self._axes.get_xlim())
+        self._xlim[1] = base**exponent
+        self._axes.set_xlim(self._xlim)
+        if draw:
+            self.drawAxes()
+
+    def setLimits(self, xlim, ylim, draw=True):
+        """
+        Sets the x and/or y limits (either may be None), except on an axis
+        that is being autoscaled, with at most one redraw.
+
+        """
+        if xlim is not None:
+            self._xlim = list(xlim)
+            if not self._axes.get_autoscalex_on():
+                self._axes.set_xlim(self._xlim)
+        if ylim is not None:
+            self._ylim = list(ylim)
+            if not self._axes.get_autoscaley_on():
+                self._axes.set_ylim(self._ylim)
+        if draw:
+            self.drawAxes()
+
+
+    def setXAxisAuto(self, auto, draw=True):
+        if bool(auto):
+            self._axes.set_autoscalex_on( True )
+        else:
+            self._axes.set_autoscalex_on( False )
+            self._axes.set_xlim(self._xlim)
+        if draw:
+            self.drawAxes()
+        self.drawCpiLines()
+
+
+    def setYAxisLo(self, value, draw=True):
+        base,exponent = SkPlotCanvas._parsePow(str(value))
+        self._ylim = list(self._axes.get_ylim())
+        self._ylim[0] = base**exponent
+        self._axes.set_ylim(self._ylim)
+        if draw:
+            self.drawAxes()
+
+    def setYAxisHi(self, value, draw=True):
+        base,exponent = SkPlotCanvas._parsePow(str(value))
+        self._ylim = list(self._axes.get_ylim())
+        self._ylim[1] = base**exponent
+        self._axes.set_ylim(self._ylim)
+        if draw:
+            self.drawAxes()
+
+    def setYAxisAuto(self, auto, draw=True):
+        if bool(auto):
+            self._axes.set_autoscaley_on( True )
+        else:
+            self._axes.set_autoscaley_on( False )
+            self._axes.set_ylim(self._ylim)
+        if draw:
+            self.drawAxes()
+
+    def setXAxisEvent(self, value, draw=True):
+        self._xevent = str(value)
+        if draw:
+            self.drawAxes()
+
+    def setYAxisEvent(self, value, draw=True):
+        self._yevent = str(value)
+        if draw:
+            self.drawAxes()
+
+#    def setXAxisScale(self, value):
+#        self._xevent = str(value)
+
+#    def setYAxisEvent(self, value):
+#        self._yevent = str(value)
+
+
+    def _applyScales(self):
+        plot.setScales(self._axes, self._xbase, self._ybase)
+
+
+    def drawAxes(self):
+        self._axesStale = True
+        self.refresh()
+
+
+    def _applyAxes(self):
+        self._axesStale = False
+        self._applyScales()
+        self._axes.set_xlabel(plot.axisLabel(self._xevent, self._xbase))
+        self._axes.set_ylabel(plot.axisLabel(self._yevent, self._ybase))
+
+
+    def setupMpl(self,  dpi, xdim, ydim):
+        # This allows us to add the subplot configuration widget later
+        # if we need to:
+        self._axes = self._fig.add_subplot('111')
+        plot.styleAxes(self._axes)
+        self._cpiLines = LineCollection([], linewidths=1.0, zorder=1)
+        self._axes.add_collection(self._cpiLines, autolim=False)
+        self._fig.subplots_adjust(bottom=0.15)
+
+        # Bind the mouse motion event for experimental purposes:
+#        self.mpl_connect('motion_notify_event', self.on_mousemove)
+
+
+#    def on_mousemove(self, evt):
+        # The event received here is of the type
+        # matplotlib.backend_bases.MouseEvent
+#        msg = "({},{}), ({:.4},{:.4})".format(int(evt.x), int(evt.y), evt.xdata, evt.ydata)
+#        self.statusBar().showMessage( msg )
@@ -2,212 +2,66 @@
    roofline based on hardware events"""
 
 import sys
-import math
 
 from PyQt4 import QtGui
 
-import numpy
-import matplotlib
-from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
-from matplotlib.colors import colorConverter as ColorConverter
-
-class SkPlotWidget(FigureCanvas):
-    def __init__(self,  parent=None):
-        self._fig    = Figure( (8, 5), dpi=96 )
-        super(SkPlotWidget, self).__init__(self._fig)
-        self.setParent(parent)
-        self._xbase  = None
-        self._ybase  = None
-        self._xevent = None
-        self._yevent = None
-        self._xlim   = None
-        self._ylim   = None
-        self._points = []
-        self._lines  = {}
-        self._cpi_lines = []
-        self._fontspec = {
-            'family': 'sans-serif',
-            'weight': 'normal',
-            'size': '11'
-        }
-
-        matplotlib.rcParams.update({'figure.autolayout': True})
-        matplotlib.rc('font', **self._fontspec)
-        self.setupMpl(100, 8, 5)
-        self.mpl_connect('pick_event', self.onPick)
-
-
-    def addPoint(self, pid, x, y, callback):
-        l=self._axes.plot(x, y, 'o', picker=5)[0]
-        self._lines[pid] = l
-        l.skCallback = callback
-        self.draw()
-        return ColorConverter.to_rgb(l.get_color())
-
-
-    def removePoint(self, pid):
-        l = self._lines.pop(pid)
-        self._axes.lines.remove(l)
-        del l
-        self.draw()
-
-
-    def clearCpiLines(self):
-        while self._cpi_lines:
-            l = self._cpi_lines.pop()
-            self._axes.lines.remove(l)
-            del l
-
-
-    def onPick(self, event):
-        event.artist.skCallback()
-
-    def drawCpiLines(self):
-        self.clearCpiLines()
-
-        x_lim = self._axes.get_xlim()
-        if self._xbase == self._ybase:
-            x = numpy.array(x_lim)
-        elif self._xbase == 0:
-            x = numpy.linspace(x_lim[0], x_lim[1], 100)
-        else:
-            x = numpy.logspace(math.log(x_lim[0], self._xbase), math.log(x_lim[1],self._xbase), 100, True, self._xbase)
-
-        self._axes.hold(True)
-        l,=self._axes.plot(x, x, '-', linewidth=1.0, color='0.5', marker=None, zorder=1)
-        self._cpi_lines.append(l)
-        for m in range(2,9):
-            y = m*x
-            l,=self._axes.plot(x, y, '-', linewidth=1.0, color=str(0.5+0.05*m), marker=None, zorder=1)
-            self._cpi_lines.append(l)
-            y = x/m
-            l,=self._axes.plot(x, y, '-', linewidth=1.0, color=str(0.5+0.05*m), marker=None, zorder=1)
-            self._cpi_lines.append(l)
-        self.draw()
-
-
-    def setXBase(self, value, draw=True):
-        self._xbase = int(str(value))
-        if draw:
-            self.drawAxes()
-
-    def setYBase(self, value, draw=True):
-        self._ybase = int(str(value))
-        if draw:
-            self.drawAxes()
-
-    @classmethod
-    def _parsePow(cls, s):
-        n = s.split('^')
-        if len(n)==1:
-            return 10, int(n[0])
-        return int(n[0]), int(n[1])
-
-    def setXAxisLo(self, value, draw=True):
-        base,exponent = SkPlotWidget._parsePow(str(value))
-        self._xlim = list(self._axes.get_xlim())
-        self._xlim[0] = base**exponent
-        self._axes.set_xlim(self._xlim)
-        if draw:
-            self.drawAxes()
-
-    def setXAxisHi(self, value, draw=True):
-        base,exponent = SkPlotWidget._parsePow(str(value))
-        self._xlim = list(self._axes.get_xlim())
-        self._xlim[1] = base**exponent
-        self._axes.set_xlim(self._xlim)
-        if draw:
-            self.drawAxes()
-
-    def setXAxisAuto(self, auto, draw=True):
-        if bool(auto):
-            self._axes.set_autoscalex_on( True )
-        else:
-            self._axes.set_autoscalex_on( False )
-            self._axes.set_xlim(self._xlim)
-        if draw:
-            self.drawAxes()
-        self.drawCpiLines()
-
-
-    def setYAxisLo(self, value, draw=True):
-        base,exponent = SkPlotWidget._parsePow(str(value))
-        self._ylim = list(self._axes.get_ylim())
-        self._ylim[0] = base**exponent
-        self._axes.set_ylim(self._ylim)
-        if draw:
-            self.drawAxes()
-
-    def setYAxisHi(self, value, draw=True):
-        base,exponent = SkPlotWidget._parsePow(str(value))
-        self._ylim = list(self._axes.get_ylim())
-        self._ylim[1] = base**exponent
-        self._axes.set_ylim(self._ylim)
-        if draw:
-            self.drawAxes()
-
-    def setYAxisAuto(self, auto, draw=True):
-        if bool(auto):
-            self._axes.set_autoscaley_on( True )
-        else:
-            self._axes.set_autoscaley_on( False )
-            self._axes.set_ylim(self._ylim)
-        if draw:
-            self.drawAxes()
-
-    def setXAxisEvent(self, value, draw=True):
-        self._xevent = str(value)
-        if draw:
-            self.drawAxes()
-
-    def setYAxisEvent(self, value, draw=True):
-        self._yevent = str(value)
-        if draw:
-            self.drawAxes()
-
-#    def setXAxisScale(self, value):
-#        self._xevent = str(value)
-
-#    def setYAxisEvent(self, value):
-#        self._yevent = str(value)
-
-
-    def drawAxes(self):
-        if self._xbase == 0:
-            self._axes.set_xscale('linear')
-            self._axes.set_xlabel(self._xevent + ' [count]')
-        else:
-            self._axes.set_xscale('log', basex=self._xbase)
-            self._axes.set_xlabel(self._xevent + ' [log_%s(count)]' % self._xbase)
-
-        if self._ybase == 0:
-            self._axes.set_yscale('linear')
-            self._axes.set_ylabel(self._yevent + ' [count]')
-        else:
-            self._axes.set_yscale('log', basey=self._ybase)
-            self._axes.set_ylabel(self._yevent + ' [log_%s(count)]' % self._ybase)
-
-        self.draw()
-
-
-    def setupMpl(self,  dpi, xdim, ydim):
-        # This allows us to add the subplot configuration widget later
-        # if we need to:
-        self._axes = self._fig.add_subplot('111')
-        self._axes.grid(True, which='both', ls='-', color='0.75')
-        self._axes.set_axisbelow(True)
-        self._fig.subplots_adjust(bottom=0.15)
-
-        # Bind the mouse motion event for experimental purposes:
-#        self.mpl_connect('motion_notify_event', self.on_mousemove)
-
-
-#    def on_mousemove(self, evt):
-        # The event received here is of the type
-        # matplotlib.backend_bases.MouseEvent
-#        msg = "({},{}), ({:.4},{:.4})".format(int(evt.x), int(evt.y), evt.xdata, evt.ydata)
-#        self.statusBar().showMessage( msg )
+
+class SkPlotWidget(QtGui.QWidget):
+    """
+    The roofline plot's place in the main window. Importing matplotlib and
+    creating its canvas take a good part of a second, so that is put off
+    until there is something to plot: `createCanvas()` creates the
+    `SkPlotCanvas`, which from then on provides every attribute that a
+    QWidget doesn't have. Calls made to the canvas' setters before then are
+    queued, and replayed on it when it is created.
+
+    """
+    DEFERRABLE = frozenset(['setXBase', 'setYBase', 'setXAxisEvent', 'setYAxisEvent',
+                            'setXAxisLo', 'setXAxisHi', 'setXAxisAuto',
+                            'setYAxisLo', 'setYAxisHi', 'setYAxisAuto', 'setLimits',
+                            'drawAxes', 'drawCpiLines', 'clearCpiLines', 'addCpiSlope', 'clearCpiSlopes',
+                            'setDensityData', 'highlightPoint', 'removePoint', 'removePoints'])
+
+    def __init__(self, parent=None):
+        super(SkPlotWidget, self).__init__(parent)
+        self._canvas = None
+        self._pending = []
+        layout = QtGui.QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+
+    def hasCanvas(self):
+        return self.__dict__.get('_canvas') is not None
+
+
+    def createCanvas(self):
+        if self._canvas is None:
+            from skillion.ui.plotcanvas import SkPlotCanvas
+            self._canvas = SkPlotCanvas(self)
+            self.layout().addWidget(self._canvas)
+            pending, self._pending = self._pending, []
+            for name, args, kwargs in pending:
+                getattr(self._canvas, name)(*args, **kwargs)
+        return self._canvas
+
+
+    def __getattr__(self, name):
+        # Only called for attributes that neither this class nor QWidget has
+        canvas = self.__dict__.get('_canvas')
+        if canvas is not None:
+            return getattr(canvas, name)
+        if name not in SkPlotWidget.DEFERRABLE:
+            raise AttributeError(name)
+
+        # Signals may be connected to this before the canvas exists, so the
+        # check has to be made on each call:
+        def deferred(*args, **kwargs):
+            if self._canvas is None:
+                self._pending.append((name, args, kwargs))
+            else:
+                getattr(self._canvas, name)(*args, **kwargs)
+        return deferred
+
 
 
 class SkTreeViewHeaderContextMenu(QtGui.QMenu):
@@ -219,10 +73,50 @@ class SkTreeViewHeaderContextMenu(QtGui.QMenu):
 #    def exec_(self, QtCore.Qt.QModelIndex qmi):
 
 
+class SkHotSpotPanel(QtGui.QDockWidget):
+    """A dockable flat table of the hottest nodes for a chosen key"""
+    DEFAULT_COUNT = 50
+
+    def __init__(self, parent=None):
+        super(SkHotSpotPanel, self).__init__('Hot spots', parent)
+        self.setObjectName('hotSpotPanel')
+
+        body = QtGui.QWidget(self)
+        layout = QtGui.QVBoxLayout(body)
+        controls = QtGui.QHBoxLayout()
+
+        self.countSpinner = QtGui.QSpinBox(body)
+        self.countSpinner.setPrefix('Top ')
+        self.countSpinner.setRange(1, 1000000)
+        self.countSpinner.setValue(SkHotSpotPanel.DEFAULT_COUNT)
+        self.countSpinner.setKeyboardTracking(False)
+        controls.addWidget(self.countSpinner)
+
+        self.levelSelector = QtGui.QComboBox(body)
+        self.levelSelector.setToolTip('Hierarchy level to rank')
+        controls.addWidget(self.levelSelector)
+
+        self.keySelector = QtGui.QComboBox(body)
+        self.keySelector.setToolTip('Event or computed column to rank by')
+        controls.addWidget(self.keySelector)
+        controls.addStretch()
+        layout.addLayout(controls)
+
+        self.tableView = QtGui.QTableView(body)
+        self.tableView.setSelectionMode(QtGui.QAbstractItemView.SingleSelection)
+        self.tableView.setSelectionBehavior(QtGui.QAbstractItemView.SelectRows)
+        self.tableView.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
+        self.tableView.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(self.tableView)
+
+        self.setWidget(body)
+
+
 
 def main():
     app = QtGui.QApplication(sys.argv)
     form = SkPlotWidget()
+    form.createCanvas()
     form.show()
     sys.exit(app.exec_())
 